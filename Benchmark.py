@@ -0,0 +1,171 @@
+import os
+import sys
+import ast
+import time
+import tempfile
+import functools
+import statistics
+import subprocess
+
+import Layout
+import Plates
+import Milling
+
+#The benchmark suite of Keyboard.py. The cases are built from model, the names defined by Keyboard.py, so they time the
+#classes of the script that is running, also the ones Sweep.py or Server.py run with their constants changed
+
+#Benchmarks that got slower by less than this many seconds aren't counted as regressions
+Noise = 0.005
+
+Folder = os.path.dirname(os.path.abspath(__file__))
+
+#Run only the definitions of a prototype script, not the build and export at the bottom
+def LoadPrototype(filename):
+    path = os.path.join(Folder, filename)
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Assign, ast.Expr)) and any(isinstance(child, ast.Call) for child in ast.walk(node)):
+            break
+        body.append(node)
+    tree.body = body
+
+    namespace = {"show_object": lambda *args, **kwargs: None}
+    exec(compile(tree, path, "exec"), namespace)
+    return namespace
+
+#Import a module in a fresh interpreter, this one has everything loaded already. Fails if it loads any of absent
+def ImportCase(module, absent=()):
+    check = F"import sys, {module}; sys.exit(any(name in sys.modules for name in {list(absent)!r}))"
+    def run():
+        result = subprocess.run([sys.executable, "-c", check], cwd=Folder)
+        if result.returncode:
+            raise RuntimeError(F"Importing {module} loaded {', '.join(absent)}")
+    return run
+
+def SpringCutsCase(model, octaves):
+    Base, KeyCommon, Octave = model.Base, model.KeyCommon, model.Octave
+    #Never built, only the methods are needed
+    base = Base()
+    body = model.cq.Workplane().box(Base.Width+(octaves-1)*Octave.Width, KeyCommon.TotalLength, Base.Height) \
+        .translate((0, KeyCommon.HiddenLength-KeyCommon.TotalLength/2, 0))
+    mounts = [Octave.GlobalKeyMountPos[key] + (i-octaves/2)*Octave.Width for i in range(octaves) for key in Octave.KeyList]
+
+    return lambda: base.SpringCuts(body, mounts)
+
+#Every different part of the keyboard, each run builds them again
+def KeyboardCase(model, first, count, baseOctaves=1):
+    return lambda: [part.Obj for part in model.Keyboard(first, count, baseOctaves).Parts().values()]
+
+def ExportCase(model, obj, export=None):
+    export = export or model.ExportSTL
+    def run():
+        #The mesh is kept on the shape after the first export, copy it so every run tessellates again
+        with tempfile.TemporaryDirectory() as folder:
+            export(model.cq.Workplane(obj=obj.val().copy()), os.path.join(folder, "Benchmark.stl"))
+    return run
+
+def AssemblyCase(model, octaves):
+    keyboard = model.Keyboard(0, 12*octaves)
+    #Build the parts first, only the placing is timed
+    model.Assembly(keyboard)
+    return lambda: model.Assembly(keyboard)
+
+def PlatesCase(model, octaves):
+    parts = model.PrintedParts(model.Keyboard(0, 12*octaves))
+    sizes = [(box.xlen, box.ylen) for box in (part.Obj.val().BoundingBox() for part in parts)]
+    return lambda: Plates.Pack(sizes, model.Args.bed, model.Args.plate_gap)
+
+#Every case is a function that is timed on its own, with the shapes shared within the case only
+def Cases(model):
+    cases = {}
+
+    #Importing Keyboard.py must not build anything or load CadQuery, which costs most of the startup
+    cases["Import Keyboard"] = ImportCase("Keyboard", ["cadquery", "OCP"])
+    cases["Import cadquery"] = ImportCase("cadquery")
+
+    Octave, WhiteKey = model.Octave, model.WhiteKey
+    cases["KeyCommon"] = lambda: model.KeyCommon(WhiteKey.KeyBaseLength, Octave.KeyBaseWidths["C"])
+    for key in Octave.KeyList:
+        if not "#" in key:
+            cases[F"WhiteKey {key}"] = WhiteKey(key).Build
+    cases["BlackKey"] = model.BlackKey("C#").Build
+    for name in ["Base", "KeySpacer", "SpringHolder", "KeyStop"]:
+        cases[name] = model.Parts[name]().Build
+
+    for octaves in [1, 2, 7]:
+        cases[F"Keyboard x{octaves}"] = KeyboardCase(model, 0, 12*octaves)
+    #The base of all 7 octaves in one piece instead of one piece per octave
+    cases["Keyboard x7 one base"] = KeyboardCase(model, 0, 84, 7)
+    cases["Keyboard 88 keys"] = KeyboardCase(model, Layout.NoteIndex("A0"), 88)
+    for octaves in [1, 2, 7]:
+        cases[F"Base.SpringCuts x{octaves}"] = SpringCutsCase(model, octaves)
+    for octaves in [1, 7]:
+        cases[F"Assembly x{octaves}"] = AssemblyCase(model, octaves)
+    for octaves in [1, 8]:
+        cases[F"Plates.Pack x{octaves}"] = PlatesCase(model, octaves)
+    tolerance = Layout.KeyLayout(Layout.NoteIndex("A0"), 88)
+    cases["Layout.Tolerance 88 keys"] = lambda: Layout.Tolerance(tolerance, 100000)
+
+    for name in ["C", "C#", "Base", "KeySpacer", "SpringHolder", "KeyStop"]:
+        cases[F"Export {name}"] = ExportCase(model, model.MakePart(name).Obj)
+    for part in [model.MakePart("C"), model.MakePart("Base")]:
+        cases[F"Milling {model.PartName(part)}"] = functools.partial(Milling.ConcaveCorners, part.Obj.val(), part.MillAxis)
+    #The exporter of CadQuery, to compare with
+    cases["Export Base cq"] = ExportCase(model, model.MakePart("Base").Obj, model.cq.exporters.export)
+
+    #The earlier design variants, to compare what they cost
+    for filename, classes in [("KeyTest.py", ["Key", "Base"]), ("KeyTest2.py", ["Key", "Base", "KeyStop"])]:
+        prototype = LoadPrototype(filename)
+        for cls in classes:
+            cases[F"{filename[:-3]}.{cls}"] = prototype[cls]
+
+    return cases
+
+#Times every case runs times, calling reset before each run so nothing built earlier is reused
+def Run(cases, runs, reset):
+    print()
+    print(F"Benchmarks ({runs} runs):")
+
+    results = {}
+    for name, case in cases.items():
+        times = []
+        for i in range(runs):
+            reset()
+            start = time.perf_counter()
+            case()
+            times.append(time.perf_counter()-start)
+
+        results[name] = {"Median": statistics.median(times), "Min": min(times)}
+        print(F"    {name+':':26}{results[name]['Median']:.6f}s  (min {results[name]['Min']:.6f}s)")
+    print()
+
+    return results
+
+#Returns the cases that got slower than the baseline by more than threshold
+def Compare(results, baseline, threshold):
+    print("Compared to baseline:")
+
+    regressed = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(F"    {name+':':26}{'new':>8}  -> {result['Median']:.6f}s")
+            continue
+
+        previous = baseline[name]["Median"]
+        change = result["Median"]/previous - 1
+        #Ignore changes too small to tell apart from noise
+        slower = change > threshold and result["Median"]-previous > Noise
+        if slower:
+            regressed.append(name)
+
+        print(F"    {name+':':26}{previous:.6f}s -> {result['Median']:.6f}s  {change*100:+7.1f}%{'  REGRESSED' if slower else ''}")
+
+    for name in baseline:
+        if name not in results:
+            print(F"    {name+':':26}{baseline[name]['Median']:.6f}s -> removed")
+    print()
+
+    return regressed
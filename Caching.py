@@ -0,0 +1,126 @@
+import os
+import json
+import time
+
+import Mesh
+
+#What Keyboard.py keeps between runs: the built shapes and their meshes on disk, and what every part was built from.
+#Parts are known by their PartHash and name in Keyboard.py
+
+#Shapes and meshes of the parts on disk, by the hash of everything they're built from
+class GeometryCache(object):
+    def __init__(self, folder, maxSize):
+        self.Folder = folder
+        self.MaxSize = maxSize
+
+        self.Hits = 0
+        self.Misses = 0
+        self.Saved = 0
+
+    def Load(self, digest):
+        path = os.path.join(self.Folder, digest)
+        try:
+            start = time.time()
+            with open(path+".brep", "rb") as f:
+                brep = f.read()
+            with open(path+".json") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            self.Misses += 1
+            return None
+
+        #Touch the file so eviction drops the least recently used shapes first
+        os.utime(path+".brep")
+        self.Hits += 1
+        self.Saved += info["BuildTime"] - (time.time()-start)
+        return brep
+
+    #kind is the class of the part, kept with it for looking through the cache
+    def Store(self, digest, kind, brep, buildtime):
+        path = os.path.join(self.Folder, digest)
+        os.makedirs(self.Folder, exist_ok=True)
+
+        #Write then rename so a concurrent reader never sees a partial shape
+        for ext, data, mode in [(".json", json.dumps({"Part": kind, "BuildTime": buildtime}), "w"), (".brep", brep, "wb")]:
+            with open(F"{path}{ext}.{os.getpid()}", mode) as f:
+                f.write(data)
+            os.replace(F"{path}{ext}.{os.getpid()}", path+ext)
+
+    #The tessellation of the part, kept next to its shape so exporting it again skips the tessellation
+    def LoadMesh(self, digest, tolerance, angularTolerance):
+        try:
+            mesh, info = Mesh.Mesh.Load(os.path.join(self.Folder, digest+".npz"))
+        except (OSError, ValueError, KeyError):
+            return None
+        if (info.get("Tolerance"), info.get("AngularTolerance")) != (tolerance, angularTolerance):
+            return None
+        return mesh
+
+    def StoreMesh(self, digest, mesh, tolerance, angularTolerance):
+        path = os.path.join(self.Folder, digest+".npz")
+        mesh.Save(F"{path}.{os.getpid()}", Tolerance=tolerance, AngularTolerance=angularTolerance)
+        os.replace(F"{path}.{os.getpid()}", path)
+
+    def Merge(self, stats):
+        self.Hits += stats[0]
+        self.Misses += stats[1]
+        self.Saved += stats[2]
+
+    def Stats(self):
+        return self.Hits, self.Misses, self.Saved
+
+    def Trim(self):
+        if not os.path.isdir(self.Folder):
+            return 0
+
+        #The shape, its info and its mesh are one entry, last used when any of them was
+        entries = {}
+        for name in os.listdir(self.Folder):
+            stem, ext = os.path.splitext(name)
+            if ext in (".brep", ".npz", ".json"):
+                path = os.path.join(self.Folder, name)
+                mtime, size, paths = entries.get(stem, (0, 0, []))
+                entries[stem] = (max(mtime, os.path.getmtime(path)), size+os.path.getsize(path), paths+[path])
+
+        total = sum(size for _, size, _ in entries.values())
+        evicted = 0
+        for _, size, paths in sorted(entries.values()):
+            if total <= self.MaxSize:
+                break
+            for path in paths:
+                os.remove(path)
+            total -= size
+            evicted += 1
+
+        return evicted
+
+#What every part was built from on the last run, to work out what changed since
+class BuildState(object):
+    def __init__(self, path):
+        self.Path = path
+        self.Parts = {}
+        self.Exports = {}
+
+        try:
+            with open(self.Path) as f:
+                state = json.load(f)
+            self.Parts = state["Parts"]
+            self.Exports = state["Exports"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def Record(self, name, digest, params, buildtime=None):
+        entry = self.Parts.setdefault(name, {})
+        entry["Hash"] = digest
+        #Round trip through json so the values compare equal to the loaded ones
+        entry["Params"] = json.loads(json.dumps(params))
+        if buildtime is not None:
+            entry["BuildTime"] = buildtime
+
+    def Changed(self, name, digest):
+        return self.Parts.get(name, {}).get("Hash") != digest
+
+    def Save(self):
+        os.makedirs(os.path.dirname(self.Path) or ".", exist_ok=True)
+        with open(self.Path, "w") as f:
+            json.dump({"Parts": self.Parts, "Exports": self.Exports}, f, indent=4)
@@ -1,21 +1,283 @@
-import cadquery as cq
 import glm
 import time
+import io
+import os
+import json
+import hashlib
+import inspect
+import sys
+import argparse
+import ast
+import types
+import statistics
+import functools
+import contextlib
+import importlib
+import multiprocessing
+import concurrent.futures
+
+import Layout
+import Mesh
+import Plates
+import Milling
+import Benchmark
+import Profiling
+import Caching
+import numpy as np
+import math
 
 t1 = time.time()
 
+#CadQuery is only imported when a shape is first needed, so the parameters and layout tables can be used from other
+#tools without loading OCCT
+class LazyImport(object):
+    def __init__(self, name):
+        self.Name = name
+        self.Module = None
+
+    def __getattr__(self, attr):
+        if self.Module is None:
+            self.Module = importlib.import_module(self.Name)
+        return getattr(self.Module, attr)
+
+cq = LazyImport("cadquery")
+
+#CQ-editor passes show_object in, anything else only builds the keyboard through main()
+CQEditor = "show_object" in globals()
+
 #Stop VS-Code undefined function error
-if "show_object" not in globals():
+if not CQEditor:
     def func(*args, **kwargs):
         pass
     show_object = func
 
+#Shapes by PartHash, kept between builds by a host that runs this script again and again like Server.py
+if "WarmShapes" not in globals():
+    WarmShapes = {}
+
 
 WallThickness = 3
 Small = 1e-5
 ExportFolder = "Export/"
+CacheFolder = ".cache/"
+#The files changed, unchanged and removed by the last export, in the export folder
+ExportChanges = "Changes.json"
+
+#Tessellation of the exported meshes in mm and radians, the same as the defaults of cq.exporters.export
+ExportTolerance = 0.1
+ExportAngularTolerance = 0.1
+
+#Volume change, as a share of the volume of the part, up to which --kernel-check counts a part as unchanged
+KernelVolumeTolerance = 1e-6
+
+#Overlaps smaller than this many mm^3 are parts touching, not interfering
+InterferenceTolerance = 1e-3
+
+#Clearance in mm is measured exactly up to this far from a part, anything further is reported as clear
+TravelMargin = 2
+#Spacing in mm of the points along the mesh edges the key travel clearance is measured from
+TravelSpacing = 0.5
+#Clearance in mm below which a key is counted as touching a part
+TravelContact = 0.01
+#Contact within this many mm of the pivot axis is the key resting on the pivot, not the key hitting the base
+TravelPivot = 1
+
+#Printer dimensional error for --tolerance: every printed size is off by PrintBias plus a normal error of PrintSigma mm,
+#outwards, so parts grow and cuts shrink
+PrintSigma = 0.05
+PrintBias = 0
+#Play in mm above which a key or the spring holder counts as wobbling
+WobbleLimit = 0.5
+
+#Bump to invalidate every cached shape, eg. after changing a helper that isn't part of a part class
+CacheVersion = 1
 
 BitSize = 3
+#Corners up to this many mm tighter than BitSize/2 still count as reached by --mill, like the fillets made Small tighter
+MillTolerance = 1e-3
+
+#Build cheap stand-ins for the finishing features (fillets, key shells, the black key loft) with the same outside
+#dimensions, for checking the layout quickly. Set by --draft, or here when working in CQ-editor. Drafts are never exported
+Draft = False
+
+#Keep only the final shape of each part, without the Workplane chain it was built through, and let go of it once the part
+#and every identical one are exported. Set by --lean. The shapes used again after the export, eg. by --check, are
+#loaded from the cache or built again
+Lean = False
+
+#Options of the OCCT boolean operations, applied to every cut, fuse and intersect run while building a part, including
+#the ones CadQuery runs inside extrude, cutBlind and the like. They can change the geometry, so they are part of every
+#PartHash. --kernel-check builds every part with these and with CadQuery's own options and compares them
+class Kernel(object):
+    #Run the steps of each boolean on all cores, CadQuery does this too
+    Parallel = True
+    #Distance in mm below which the two shapes are treated as touching, 0 for exact (CadQuery's default)
+    Fuzzy = 0
+    #Gluing of coinciding faces: "Off", "Shift" (faces either coincide or don't touch) or "Full" (shapes only touch).
+    #Shift keeps the fused parts the same, but what it saves on them is within the noise of --kernel-check. On the
+    #cuts it gives solids that are valid but have the wrong volume, as the cutters go through the faces they cut
+    FuseGlue = "Off"
+    CutGlue = "Off"
+    #Skip sub-shapes whose oriented bounding boxes don't overlap
+    UseOBB = False
+
+    #What CadQuery does without these options
+    Defaults = {"Parallel": True, "Fuzzy": 0, "FuseGlue": "Off", "CutGlue": "Off", "UseOBB": False}
+
+    @classmethod
+    def Settings(cls):
+        return {name: getattr(cls, name) for name in cls.Defaults}
+
+    #Set the options for the booleans in the block and restore them after
+    @classmethod
+    @contextlib.contextmanager
+    def Using(cls, settings):
+        previous = cls.Settings()
+        for name, value in settings.items():
+            setattr(cls, name, value)
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                setattr(cls, name, value)
+
+    #Every boolean of CadQuery's shapes goes through Shape._bool_op, which reads the options when it runs. Done the first
+    #time a part is built, and only when an option differs from CadQuery's, otherwise the wrapper of an earlier Apply is
+    #taken off again. A host running this script again, like Server.py, gets a new Kernel class each time, which replaces
+    #the wrapper of the previous one instead of wrapping it again
+    @classmethod
+    def Apply(cls):
+        current = cq.Shape._bool_op
+        boolOp = current.__wrapped__ if getattr(current, "Kernel", None) is not None else current
+        if cls.Settings() == cls.Defaults:
+            cq.Shape._bool_op = boolOp
+            return
+        if getattr(current, "Kernel", None) is cls:
+            return
+
+        from OCP.BOPAlgo import BOPAlgo_GlueEnum
+        from OCP.BRepAlgoAPI import BRepAlgoAPI_Fuse, BRepAlgoAPI_Cut
+        glues = {"Shift": BOPAlgo_GlueEnum.BOPAlgo_GlueShift, "Full": BOPAlgo_GlueEnum.BOPAlgo_GlueFull}
+
+        #Only the options that differ from CadQuery's are set, the rest stay the way the caller asked for them
+        @functools.wraps(boolOp)
+        def wrapper(self, args, tools, op, parallel=True):
+            glue = cls.FuseGlue if isinstance(op, BRepAlgoAPI_Fuse) else cls.CutGlue if isinstance(op, BRepAlgoAPI_Cut) else "Off"
+            if glue != "Off":
+                op.SetGlue(glues[glue])
+            #Keep a larger tolerance given by the caller
+            if cls.Fuzzy > op.FuzzyValue():
+                op.SetFuzzyValue(cls.Fuzzy)
+            if cls.UseOBB:
+                op.SetUseOBB(True)
+            return boolOp(self, args, tools, op, parallel and cls.Parallel)
+
+        wrapper.Kernel = cls
+        cq.Shape._bool_op = wrapper
+
+#Parses NAME=VALUE of --kernel, VALUE is a Python literal or else taken as a string, eg. FuseGlue=Shift
+def KernelSetting(setting):
+    name, _, value = setting.partition("=")
+    if name not in Kernel.Defaults:
+        raise argparse.ArgumentTypeError(F"no Kernel option {name}, the options are {', '.join(Kernel.Defaults)}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+Parser = argparse.ArgumentParser(description="Generate the keytar keyboard models")
+Parser.add_argument("--jobs", type=int, nargs="?", default=1, const=os.cpu_count(),
+    help="Build the parts in N worker processes (all cores if N is omitted)")
+Parser.add_argument("--export-jobs", type=int,
+    help="Export the STLs in N worker processes while the build carries on (defaults to --jobs)")
+Parser.add_argument("--no-cache", dest="cache", action="store_false",
+    help="Always rebuild the parts instead of loading them from the geometry cache")
+Parser.add_argument("--cache-dir", default=CacheFolder,
+    help=F"Folder the geometry cache is stored in (default {CacheFolder})")
+Parser.add_argument("--cache-size", type=float, default=256,
+    help="Size limit of the geometry cache in MB, least recently used shapes are evicted first")
+Parser.add_argument("--export-all", action="store_true",
+    help="Rewrite every STL, even the ones whose part hasn't changed since the last run")
+Parser.add_argument("--plan", action="store_true",
+    help="Print which parts changed since the last run and need rebuilding, then exit")
+Parser.add_argument("--affected", metavar="PARAM", action="append", default=[],
+    help="Print the parts a change to PARAM (eg. KeySpacer.Gap) would rebuild, then exit")
+Parser.add_argument("--octaves", type=int, default=1,
+    help="Number of octaves from C0 (default 1)")
+Parser.add_argument("--range", metavar="FIRST-LAST",
+    help="Range of keys to build instead of whole octaves, eg. A0-C8 for an 88 key piano")
+Parser.add_argument("--base-octaves", type=int, default=1, metavar="N",
+    help="Split the base into pieces of N octaves on the spacer left of a C (default 1)")
+Parser.add_argument("--draft", action="store_true",
+    help="Build without fillets, key shells and the black key loft to preview quickly, nothing is exported")
+Parser.add_argument("--kernel", metavar="NAME=VALUE", type=KernelSetting, action="append", default=[],
+    help="Set an option of the OCCT booleans in Kernel, eg. Fuzzy=1e-4 or FuseGlue=Shift")
+Parser.add_argument("--kernel-check", action="store_true",
+    help="Build every part with CadQuery's boolean options and with Kernel's, compare the time, validity and volume")
+Parser.add_argument("--check", action="store_true",
+    help="Check the assembled parts for interference after the build")
+Parser.add_argument("--assembly", metavar="FILE",
+    help="Also write the assembled parts to one .3mf, .step or .stl file in the export folder, repeated parts stored once")
+Parser.add_argument("--assembly-parts", metavar="NAMES", type=lambda names: names.split(","),
+    help="Comma separated parts to put in the assembly, eg. C#,KeySpacer (default all)")
+Parser.add_argument("--plates", action="store_true",
+    help="Also pack every printed part onto build plates, writing one 3MF per plate to the export folder")
+Parser.add_argument("--bed", default=(220, 220), metavar="WxD", type=lambda size: tuple(float(value) for value in size.split("x")),
+    help="Size of the build plate in mm (default 220x220)")
+Parser.add_argument("--plate-gap", type=float, default=3,
+    help="Space in mm left between the parts on a plate (default 3)")
+Parser.add_argument("--tolerance", type=int, nargs="?", const=1000000, metavar="SAMPLES",
+    help="Sample the printer error of the fits and report the chance each key binds or wobbles, then exit (default 1000000)")
+Parser.add_argument("--tolerance-gaps", metavar="GAPS", type=lambda gaps: [float(gap) for gap in gaps.split(",")],
+    help="Compare the chances for each of these values of KeySpacer.Gap and SpringHolder.Gap, eg. 0.1,0.15,0.2")
+Parser.add_argument("--mill", action="store_true",
+    help="Report the concave corners of every part tighter than a BitSize bit can reach")
+Parser.add_argument("--simulate", type=int, nargs="?", const=10, metavar="STEPS",
+    help="Step every key from rest to full travel and report its clearance to the parts around it (default 10 steps)")
+Parser.add_argument("--lean", action="store_true",
+    help="Keep only the final shapes and drop each part once it's exported, to keep the memory down on large keyboards")
+Parser.add_argument("--memory", action="store_true",
+    help="Report the peak memory of building and exporting each part")
+Parser.add_argument("--memory-budget", type=float, metavar="MB",
+    help="Fail if building and exporting any part takes the process over MB of resident memory, implies --memory")
+Parser.add_argument("--profile", metavar="FILE", nargs="?", const="profile.json",
+    help="Time every part, feature and CadQuery operation and save them as a Chrome trace (default profile.json)")
+Parser.add_argument("--profile-top", metavar="N", type=int, default=20,
+    help="Number of entries in the profile table (default 20)")
+Parser.add_argument("--benchmark", action="store_true",
+    help="Time every part, the export and the prototype parts, compare them with the baseline and exit")
+Parser.add_argument("--benchmark-save", action="store_true",
+    help="Run the benchmarks and save the results as the new baseline")
+Parser.add_argument("--benchmark-file", default="Benchmark.json",
+    help="Baseline the benchmarks are saved to and compared with (default Benchmark.json)")
+Parser.add_argument("--benchmark-runs", type=int, default=5,
+    help="Times each benchmark is run, the median is compared (default 5)")
+Parser.add_argument("--benchmark-threshold", type=float, default=0.25,
+    help="Fail if a benchmark gets slower than the baseline by more than this fraction (default 0.25)")
+#The defaults until main() reads the command line
+Args = Parser.parse_args([])
+
+#The shape of a part is built the first time Obj is used, so parts can be made just to read their parameters
+class Part(object):
+    #Direction of the milling bit --mill checks the concave corners along, see Milling.py
+    MillAxis = (0, 0, 1)
+
+    def __init__(self, obj=None):
+        self.Built = obj
+
+    @property
+    def Obj(self):
+        if self.Built is None:
+            self.Built = BuildObj(self)
+        return self.Built
+
+    #The shape turned the way it sits in the keyboard, before it's moved into place
+    def Oriented(self):
+        return self.Obj
+
+    def Placed(self, position):
+        return Instance(self.Oriented(), position)
+
 
 class Octave(object):
     Width = 24*7
@@ -24,45 +286,28 @@ class Octave(object):
     KeyList = ["C","C#","D","D#","E","F","F#","G","G#","A","A#","B"]
 
     KeyOffsets = {}
-    KeyLeft = {}
-    KeyRight = {}
     KeyBaseWidths = {}
     KeyBaseOffsets = {}
     GlobalKeyMountPos ={}
 
-    def __init__(self):
-        self.Keys = [
-            WhiteKey("C"),
-            BlackKey("C#"),
-            WhiteKey("D"),
-            BlackKey("D#"),
-            WhiteKey("E"),
-            WhiteKey("F"),
-            BlackKey("F#"),
-            WhiteKey("G"),
-            BlackKey("G#"),
-            WhiteKey("A"),
-            BlackKey("A#"),
-            WhiteKey("B")
-        ]
-
-    def Show(self):
-        for key in self.Keys:
-            key.Show()
-    
-    def Export(self):
-        for key in self.Keys:
-            cq.exporters.export(key.Obj, ExportFolder+key.Key+".stl")
+    @staticmethod
+    def MakeKey(key, obj=None):
+        if "#" in key:
+            return BlackKey(key, obj)
+        return WhiteKey(key, obj)
 
 
-class SpringHolder(object):
+class SpringHolder(Part):
     Gap = 0.2
     HolderLength = 5
 
     SpringDiameter = 3
     SpringHoleDiam = SpringDiameter+1
 
-    def __init__(self):
+    def __init__(self, obj=None):
+        Part.__init__(self, obj)
+
+    def Build(self):
         holder = cq.Workplane("XY") \
             .circle(self.SpringHoleDiam/2-self.Gap).extrude(-self.HolderLength-self.SpringDiameter) \
             .faces(">Z").workplane() \
@@ -83,18 +328,26 @@ class SpringHolder(object):
             .move(-self.SpringHoleDiam/2+(self.SpringHoleDiam/3)/4, (self.SpringDiameter/2+2)/2) \
             .rect(self.SpringHoleDiam/3, self.SpringDiameter/2+2).cutThruAll(5)
 
-        self.Obj = holder
+        return holder
+
+    def Params(self):
+        return {
+            "SpringHolder.Gap": self.Gap,
+            "SpringHolder.HolderLength": self.HolderLength,
+            "SpringHolder.SpringDiameter": self.SpringDiameter,
+            "SpringHolder.SpringHoleDiam": self.SpringHoleDiam,
+        }
     
-    def Show(self):
+    #Upside down, the way it sits in the base. Mirroring can't be done with a location, so this is a copy
+    def Oriented(self):
+        return self.Obj.mirror("XY").rotate((0,0,0), (0,0,1), 180)
+
+    def Show(self, position):
         # show_object(self.Obj.translate((0,0,50)))
-        show_object(
-            self.Obj.mirror("XY").rotate((0,0,0), (0,0,1), 180).translate(
-                (Octave.GlobalKeyMountPos["C"]-(self.SpringHoleDiam/2+0.5), KeyCommon.SpringPos, -KeyCommon.Travel-KeyCommon.Height/2-Base.Height)
-            )
-        )
+        show_object(self.Placed(position))
 
     def Export(self):
-        cq.exporters.export(self.Obj, ExportFolder+"SpringHolder.stl")
+        ExportObj(self, "SpringHolder.stl")
 
 
 class KeyCommon(object):
@@ -110,6 +363,10 @@ class KeyCommon(object):
         self.Width = keybaseWidth
         self.TotalLength = self.KeyBaseLength+self.HiddenLength
 
+        #Keys with the same base size share one body
+        self.Obj = Memo.Get("KeyCommon", self.Params(keybaseLength, keybaseWidth), self.Build)
+
+    def Build(self):
         common = cq.Workplane().box(self.Width, self.TotalLength, self.Height) \
             .translate((0,self.TotalLength/2-self.KeyBaseLength,0))
 
@@ -117,10 +374,26 @@ class KeyCommon(object):
         common = self.SpacerCut(common)
         common = self.PivotCut(common)
 
-        self.Obj = common
-
-
-    PivotPos = cq.Vector(25, 0) #offset from center
+        return common
+
+    #Parameters the common body is built from, merged into the parameters of each key
+    @staticmethod
+    def Params(keybaseLength, keybaseWidth):
+        return {
+            "KeyCommon.KeyBaseLength": keybaseLength,
+            "KeyCommon.Width": keybaseWidth,
+            "KeyCommon.HiddenLength": KeyCommon.HiddenLength,
+            "KeyCommon.Height": KeyCommon.Height,
+            "KeyCommon.PivotPos": tuple(KeyCommon.PivotPos),
+            "KeyCommon.SpringPos": KeyCommon.SpringPos,
+            "SpringHolder.SpringHoleDiam": SpringHolder.SpringHoleDiam,
+            "KeySpacer.WallThick": KeySpacer.WallThick,
+            "KeySpacer.WallSize": KeySpacer.WallSize,
+            "KeySpacer.Gap": KeySpacer.Gap,
+            "Octave.KeySpacing": Octave.KeySpacing,
+        }
+
+    PivotPos = glm.dvec2(25, 0) #offset from center
 
     def PivotCut(self, common):
         cut = common.faces(">X").workplane().move(self.PivotPos.x, self.PivotPos.y-self.Height/2) \
@@ -151,19 +424,37 @@ class KeyCommon(object):
         return cut
 
 
-class WhiteKey(object):
+class WhiteKey(Part):
+    Depends = [KeyCommon]
+
     ExtendedLength = 40
     KeyBaseLength = KeyCommon.ExposedLength-ExtendedLength
     Width = Octave.Width/7-Octave.KeySpacing
 
-    def __init__(self, key):
+    def __init__(self, key, obj=None):
         self.Key = key
+        Part.__init__(self, obj)
 
+    def Build(self):
         keyobj = self.KeyBase() + self.Extension()
 
-        keyobj = keyobj.faces("<Z").faces("<Y").shell(-WallThickness)
+        #Left solid in a draft, the outside is the same
+        if not Draft:
+            keyobj = keyobj.faces("<Z").faces("<Y").shell(-WallThickness)
 
-        self.Obj = keyobj
+        return keyobj
+
+    def Params(self):
+        return {
+            **KeyCommon.Params(self.KeyBaseLength, Octave.KeyBaseWidths[self.Key]),
+            "WhiteKey.KeyBaseLength": self.KeyBaseLength,
+            F"Octave.KeyBaseWidths[{self.Key}]": Octave.KeyBaseWidths[self.Key],
+            "WhiteKey.ExtendedLength": self.ExtendedLength,
+            "WhiteKey.Width": self.Width,
+            F"Octave.KeyBaseOffsets[{self.Key}]": Octave.KeyBaseOffsets[self.Key],
+            "WallThickness": WallThickness,
+            "Draft": Draft,
+        }
 
     def KeyBase(self):
         keybase = KeyCommon(self.KeyBaseLength, Octave.KeyBaseWidths[self.Key]).Obj
@@ -175,29 +466,45 @@ class WhiteKey(object):
 
         return keyextend.translate((0, -(self.KeyBaseLength+self.ExtendedLength/2), 0))
 
-    def GetPosition(self):
-        return cq.Vector(self.Width/2+Octave.KeyOffsets[self.Key], 0, 0)
+    def Show(self, position):
+        show_object(self.Placed(position), options={"color":(255,255,255), "alpha":0})
 
-    def Show(self):
-        show_object(self.Obj.translate(self.GetPosition()), options={"color":(255,255,255), "alpha":0})
+    def Export(self):
+        ExportObj(self, self.Key+".stl")
 
 #Black key is positioned relative to the center of the white key
-class BlackKey(object):
+class BlackKey(Part):
+    Depends = [KeyCommon]
+
     KeyBaseLength = WhiteKey.KeyBaseLength-Octave.KeySpacing
     KeyBaseWidth = Octave.Width/12-Octave.KeySpacing
 
-    def __init__(self, key):
+    def __init__(self, key, obj=None):
         self.Key = key
+        self.TotalLength = self.KeyBaseLength+KeyCommon.HiddenLength
 
-        self.Common = KeyCommon(self.KeyBaseLength, self.KeyBaseWidth)
-        self.TotalLength = self.Common.TotalLength
-        
-        keyobj = self.Common.Obj
+        Part.__init__(self, obj)
+
+    def Build(self):
+        keyobj = KeyCommon(self.KeyBaseLength, self.KeyBaseWidth).Obj
         keyobj = self.Keytop(keyobj)
 
-        keyobj = keyobj.faces("<Z").faces("<Y").shell(-WallThickness)
+        if not Draft:
+            keyobj = keyobj.faces("<Z").faces("<Y").shell(-WallThickness)
 
-        self.Obj = keyobj
+        return keyobj
+
+    def Params(self):
+        return {
+            **KeyCommon.Params(self.KeyBaseLength, self.KeyBaseWidth),
+            "BlackKey.KeyBaseLength": self.KeyBaseLength,
+            "BlackKey.KeyBaseWidth": self.KeyBaseWidth,
+            "BlackKey.TopWidth": self.TopWidth,
+            "BlackKey.TopLength": self.TopLength,
+            "BlackKey.TopHeight": self.TopHeight,
+            "WallThickness": WallThickness,
+            "Draft": Draft,
+        }
 
     TopWidth = KeyBaseWidth-3
     TopLength = KeyBaseLength-3
@@ -207,102 +514,37 @@ class BlackKey(object):
         length = self.KeyBaseLength-1
         top = key.faces(">Z").workplane(centerOption="CenterOfBoundBox") \
             .center(0,(self.KeyBaseLength+KeyCommon.HiddenLength)/2 - KeyCommon.HiddenLength - (self.KeyBaseLength+self.KeyBaseLength-length)/2) \
-            .rect(self.KeyBaseWidth, length) \
-            .workplane(offset=self.TopHeight) \
+            .rect(self.KeyBaseWidth, length)
+
+        #A draft extrudes the bottom of the loft, which has the same bounding box
+        if Draft:
+            return top.extrude(self.TopHeight)
+
+        top = top.workplane(offset=self.TopHeight) \
             .move(0,length/2-self.TopLength/2).rect(self.TopWidth, self.TopLength) \
             .loft()
         #.center(0,(self.KeyBaseLength+KeyCommon.HiddenLength)/2-KeyCommon.HiddenLength)
         return top
 
-    def GetPosition(self):
-        return cq.Vector(WhiteKey.Width/2+Octave.KeyOffsets[self.Key], 0, 0)
-
-    def Show(self):
-        show_object(self.Obj.translate(self.GetPosition()), options={"color":(20,20,20), "alpha":0})
-
-
-#Initialize the positioning of all the white keys
-Octave.KeyOffsets = {
-    "C":Octave.KeySpacing/2 + 0*Octave.Width/7,
-    "D":Octave.KeySpacing/2 + 1*Octave.Width/7,
-    "E":Octave.KeySpacing/2 + 2*Octave.Width/7,
-    "F":Octave.KeySpacing/2 + 3*Octave.Width/7,
-    "G":Octave.KeySpacing/2 + 4*Octave.Width/7,
-    "A":Octave.KeySpacing/2 + 5*Octave.Width/7,
-    "B":Octave.KeySpacing/2 + 6*Octave.Width/7,
-}
-
-#Calculate the global position of the left side of each key
-Octave.KeyLeft = {}
-for key, offset in Octave.KeyOffsets.items():
-    Octave.KeyLeft[key] = offset - WhiteKey.Width/2 + BlackKey.KeyBaseWidth/2
-
-#Calculate the global position of the right side of each key
-Octave.KeyRight = {}
-for key, offset in Octave.KeyOffsets.items():
-    Octave.KeyRight[key] = offset + WhiteKey.Width/2 - BlackKey.KeyBaseWidth/2
-
-#Default sizing of the mounts
-Octave.KeyBaseWidths = {
-    "C":Octave.Width/12-Octave.KeySpacing,
-    # "D":Octave.Width/12-Octave.KeySpacing,
-    "E":Octave.Width/12-Octave.KeySpacing,
-    "F":Octave.Width/12-Octave.KeySpacing,
-    # "G":Octave.Width/12-Octave.KeySpacing,
-    # "A":Octave.Width/12-Octave.KeySpacing,
-    "B":Octave.Width/12-Octave.KeySpacing,
-}
-
-#Offsets of the black keys calculated relative to the white keys
-Octave.KeyOffsets["C#"] = Octave.KeyLeft["C"] + BlackKey.KeyBaseWidth + Octave.KeySpacing
-Octave.KeyOffsets["D#"] = Octave.KeyRight["E"] - BlackKey.KeyBaseWidth - Octave.KeySpacing
-Octave.KeyOffsets["F#"] = Octave.KeyLeft["F"] + BlackKey.KeyBaseWidth + Octave.KeySpacing
-Octave.KeyOffsets["G#"] = Octave.KeyOffsets["G"] + WhiteKey.Width/2 + Octave.KeySpacing/2
-Octave.KeyOffsets["A#"] = Octave.KeyRight["B"] - BlackKey.KeyBaseWidth - Octave.KeySpacing
-
-#Offsets from the key extension to place the base. (white keys only)
-# #Calculation is relative to rectangle centers 
-Octave.KeyBaseOffsets = {
-    "C":-WhiteKey.Width/2 + Octave.KeyBaseWidths["C"]/2,
-    "D":0,
-    "E":WhiteKey.Width/2 - Octave.KeyBaseWidths["E"]/2,
-    "F":-WhiteKey.Width/2 + Octave.KeyBaseWidths["F"]/2,
-    "G":(Octave.KeyOffsets["F#"]+Octave.KeyOffsets["G#"])/2 - Octave.KeyOffsets["G"],
-    "A":(Octave.KeyOffsets["G#"]+Octave.KeyOffsets["A#"])/2 - Octave.KeyOffsets["A"],
-    "B":WhiteKey.Width/2 - Octave.KeyBaseWidths["B"]/2,
-}
-
-#Adjust widths based on the black key positioning
-#The size is the distance between the two keys, minus the 2x the spacing
-Octave.KeyBaseWidths["D"] = Octave.KeyOffsets["D#"]-Octave.KeyOffsets["C#"] - BlackKey.KeyBaseWidth - Octave.KeySpacing*2
-Octave.KeyBaseWidths["G"] = Octave.KeyOffsets["G#"]-Octave.KeyOffsets["F#"] - BlackKey.KeyBaseWidth - Octave.KeySpacing*2
-Octave.KeyBaseWidths["A"] = Octave.KeyOffsets["A#"]-Octave.KeyOffsets["G#"] - BlackKey.KeyBaseWidth - Octave.KeySpacing*2
-
+    def Show(self, position):
+        show_object(self.Placed(position), options={"color":(20,20,20), "alpha":0})
 
-#Global positions of the center of the mounts of each key
-Octave.GlobalKeyMountPos ={
-    "C":Octave.KeyOffsets["C"]+Octave.KeyBaseOffsets["C"]+ WhiteKey.Width/2,
-    "C#":Octave.KeyOffsets["C#"] + WhiteKey.Width/2,
-    "D":Octave.KeyOffsets["D"]+Octave.KeyBaseOffsets["D"]+ WhiteKey.Width/2,
-    "D#":Octave.KeyOffsets["D#"] + WhiteKey.Width/2,
-    "E":Octave.KeyOffsets["E"]+Octave.KeyBaseOffsets["E"]+ WhiteKey.Width/2,
-    "F":Octave.KeyOffsets["F"]+Octave.KeyBaseOffsets["F"]+ WhiteKey.Width/2,
-    "F#":Octave.KeyOffsets["F#"] + WhiteKey.Width/2,
-    "G":Octave.KeyOffsets["G"]+Octave.KeyBaseOffsets["G"]+ WhiteKey.Width/2,
-    "G#":Octave.KeyOffsets["G#"] + WhiteKey.Width/2,
-    "A":Octave.KeyOffsets["A"]+Octave.KeyBaseOffsets["A"]+ WhiteKey.Width/2,
-    "A#":Octave.KeyOffsets["A#"] + WhiteKey.Width/2,
-    "B":Octave.KeyOffsets["B"]+Octave.KeyBaseOffsets["B"]+ WhiteKey.Width/2
-}
+    def Export(self):
+        ExportObj(self, self.Key+".stl")
 
 
-class KeySpacer(object):
+class KeySpacer(Part):
 
     WallSize = 7
     WallThick = 3
     Gap = 0.2
+    #The profile is cut across the wall, the fillets for the bit run along X
+    MillAxis = (1, 0, 0)
 
-    def __init__(self):
+    def __init__(self, obj=None):
+        Part.__init__(self, obj)
+
+    def Build(self):
         align = cq.Workplane("YZ").move(KeyCommon.PivotPos.x, 0) \
         .move(self.WallSize+5, self.Gap) \
         .line(0, KeyCommon.Travel-self.Gap) \
@@ -312,6 +554,9 @@ class KeySpacer(object):
 
         align -= self.PivotCut()
 
+        if Draft:
+            return align
+
         # align = align.edges("<Z and |X and <Y[-1]").fillet(BitSize)
         align = align.edges(
             cq.selectors.SumSelector(
@@ -319,7 +564,19 @@ class KeySpacer(object):
                 cq.selectors.NearestToPointSelector((0,KeyCommon.PivotPos.x+1,0))
             )).fillet(BitSize/2)
 
-        self.Obj = align
+        return align
+
+    def Params(self):
+        return {
+            "KeySpacer.WallSize": self.WallSize,
+            "KeySpacer.WallThick": self.WallThick,
+            "KeySpacer.Gap": self.Gap,
+            "KeyCommon.PivotPos": tuple(KeyCommon.PivotPos),
+            "KeyCommon.Travel": KeyCommon.Travel,
+            "KeyCommon.Height": KeyCommon.Height,
+            "BitSize": BitSize,
+            "Draft": Draft,
+        }
 
     def PivotCut(self):
         spikeHeight = 7
@@ -332,39 +589,65 @@ class KeySpacer(object):
         
         return pivot
 
-    def ShowKeySpacers(self, base):
-        pos = base.GetPosition() + cq.Vector((-Octave.Width/2, 0, base.Height/2))
+    def Show(self, position):
+        show_object(self.Placed(position), options={"alpha":0.5})
 
-        show_object(self.Obj.translate(
-            cq.Vector(Octave.GlobalKeyMountPos["C"]-Octave.KeyBaseWidths["C"]/2-Octave.KeySpacing/2, 0, 0) + pos
-        ), options={"alpha":0.5})
+    def Export(self):
+        ExportObj(self, "KeySpacer.stl")
 
-        for key in Octave.KeyList:
-            if not "#" in key:
-                show_object(self.Obj.translate(
-                    cq.Vector(Octave.GlobalKeyMountPos[key]+Octave.KeyBaseWidths[key]/2+Octave.KeySpacing/2, 0, 0) + pos
-                ), options={"alpha":0.5})
-            else:
-                show_object(self.Obj.translate(
-                    cq.Vector(Octave.GlobalKeyMountPos[key]+BlackKey.KeyBaseWidth/2+Octave.KeySpacing/2, 0, 0) + pos
-                ), options={"alpha":0.5})
 
-    def Export(self):
-        cq.exporters.export(self.Obj, ExportFolder+"KeySpacer.stl")
+#Initialize the positioning of all the keys, see Layout.py for the calculations
+OctaveLayout = Layout.KeyLayout(0, 12, Octave.Width, Octave.KeySpacing, KeySpacer.WallThick, KeySpacer.Gap)
 
+Octave.KeyOffsets = OctaveLayout.Table(OctaveLayout.KeyOffsets)
 
+#Sizing of the mounts, the D, G and A mounts fill the space between the black keys
+Octave.KeyBaseWidths = OctaveLayout.Table(OctaveLayout.BaseWidths, whiteOnly=True)
 
-class Base(object):
-    Height = 4
-    Width = Octave.Width+KeySpacer.WallThick+KeySpacer.Gap*2
+#Offsets from the key extension to place the base. (white keys only)
+#Calculation is relative to rectangle centers
+Octave.KeyBaseOffsets = OctaveLayout.Table(OctaveLayout.BaseOffsets, whiteOnly=True)
 
-    def __init__(self):
+#Global positions of the center of the mounts of each key
+Octave.GlobalKeyMountPos = OctaveLayout.Table(OctaveLayout.MountPos)
+
+if not OctaveLayout.Valid[0]:
+    print(F"Warning: keys or spacers overlap, clearances {OctaveLayout.Clearance[0].round(3)}")
+
+
+class Base(Part):
+    Height = 4
+    #How far the base reaches past the spacer at each end
+    End = KeySpacer.WallThick/2+KeySpacer.Gap
+    Width = Octave.Width+End*2
+    Name = "Base"
+    #The pivot is cut along X, like its fillets for the bit
+    MillAxis = (1, 0, 0)
+
+    #A piece of a longer base spans the span mm between the spacers at its ends, mounts are the centers of its key mounts
+    #from the spacer on the left. Only the ends of the whole base reach past the spacers, at a seam between pieces each
+    #carries half the post the key stops stand on there
+    def __init__(self, obj=None, span=None, mounts=None, ends=(True, True), name=None):
+        self.Span = span if span is not None else Octave.Width
+        self.Mounts = mounts if mounts is not None else [Octave.GlobalKeyMountPos[key] for key in Octave.KeyList]
+        self.Ends = tuple(ends)
+        self.Width = self.Span+self.End*sum(self.Ends)
+        self.Name = name or self.Name
+        #From the middle of the span to the middle of the base, which is off center when only one end reaches out
+        self.Shift = self.End*(self.Ends[1]-self.Ends[0])/2
+
+        Part.__init__(self, obj)
+
+    def Build(self):
         base = cq.Workplane().box(self.Width, KeyCommon.TotalLength, self.Height) \
-            .translate((0, KeyCommon.HiddenLength-KeyCommon.TotalLength/2, 0))
+            .translate((self.Shift, KeyCommon.HiddenLength-KeyCommon.TotalLength/2, 0))
 
         base = self.SpringCuts(base)
-        base += self.Pivot()
-        base += self.KeyStopMount()
+        #Fuse the pivot and both mounts in a single boolean
+        base = base.union(self.Pivot().add(self.KeyStopMount()))
+
+        if Draft:
+            return base
 
         # Fillet along Pivot
         base = base.edges(cq.selectors.BoxSelector(
@@ -373,7 +656,30 @@ class Base(object):
             ()
         )).fillet(BitSize/2-Small)
 
-        self.Obj = base
+        return base
+
+    def Params(self):
+        return {
+            "Base.Height": self.Height,
+            "Base.Width": self.Width,
+            "Base.Span": self.Span,
+            "Base.Ends": list(self.Ends),
+            "Octave.GlobalKeyMountPos": self.Mounts,
+            "KeyCommon.TotalLength": KeyCommon.TotalLength,
+            "KeyCommon.HiddenLength": KeyCommon.HiddenLength,
+            "KeyCommon.Height": KeyCommon.Height,
+            "KeyCommon.Travel": KeyCommon.Travel,
+            "KeyCommon.PivotPos": tuple(KeyCommon.PivotPos),
+            "KeyCommon.SpringPos": KeyCommon.SpringPos,
+            "SpringHolder.SpringHoleDiam": SpringHolder.SpringHoleDiam,
+            "KeySpacer.WallSize": KeySpacer.WallSize,
+            "KeySpacer.WallThick": KeySpacer.WallThick,
+            "KeyStop.SeamPost": KeyStop.SeamPost,
+            "WallThickness": WallThickness,
+            "BitSize": BitSize,
+            "Small": Small,
+            "Draft": Draft,
+        }
 
     def Pivot(self):
         spikeHeight = 7
@@ -384,106 +690,1174 @@ class Base(object):
             .line(0,-(KeyCommon.Travel+KeyCommon.Height/2+KeyCommon.PivotPos.y-spikeHeight)).close() \
             .extrude(self.Width/2, both=True)
         
-        return pivot
+        return pivot.translate((self.Shift, 0, 0))
 
-    def SpringCuts(self, base):
-        for key in Octave.KeyList:
-            base = base.faces(">Z").workplane(centerOption="CenterOfBoundBox") \
-                .center(Octave.GlobalKeyMountPos[key]-Octave.Width/2, KeyCommon.TotalLength/2-KeyCommon.HiddenLength) \
-                .move(SpringHolder.SpringHoleDiam/2+0.5, KeyCommon.SpringPos).circle(SpringHolder.SpringHoleDiam/2).mirrorY() \
-                .cutThruAll()
+    #Cut the holes for every key in one boolean, cutting them one at a time gets slower with every hole.
+    #mounts are the centers of the key mounts relative to the middle of the span
+    def SpringCuts(self, base, mounts=None):
+        if mounts is None:
+            mounts = [mount-self.Span/2 for mount in self.Mounts]
 
-        return base
+        offset = SpringHolder.SpringHoleDiam/2+0.5
+        points = []
+        for mount in mounts:
+            points += [(mount-offset, KeyCommon.SpringPos), (mount+offset, KeyCommon.SpringPos)]
+
+        holes = cq.Workplane("XY").pushPoints(points) \
+            .circle(SpringHolder.SpringHoleDiam/2) \
+            .extrude(self.Height, both=True)
+
+        return base.cut(holes)
 
+    #A mount outside each end of the whole base, and half a post in front of the spacer at each seam, see KeyStop, so
+    #the pieces either side make up one post
     def KeyStopMount(self):
         width = KeyCommon.PivotPos.x+KeySpacer.WallSize
 
-        mount = cq.Workplane("XY").move(self.Width/2+WallThickness/2, width/2) \
-            .rect(WallThickness, width).mirrorY() \
-            .extrude(self.Height+KeyCommon.Travel)
+        mount = cq.Workplane("XY")
+        for side, end in zip((-1, 1), self.Ends):
+            if end:
+                center, size = (self.Shift+side*(self.Width/2+WallThickness/2), width/2), (WallThickness, width)
+            else:
+                front, back = KeyStop.SeamPost
+                center, size = (side*(self.Span/2-KeySpacer.WallThick/4), (front+back)/2), (KeySpacer.WallThick/2, back-front)
+            mount = mount.add(cq.Workplane("XY").center(*center).rect(*size).extrude(self.Height+KeyCommon.Travel))
 
         # show_object(mount)
 
         return mount.translate((0,0,-self.Height/2))
 
 
-    def GetPosition(self):
-        return cq.Vector(Octave.Width/2, 0, -KeyCommon.Height/2-self.Height/2-KeyCommon.Travel)
-
-    def Show(self):
-        show_object(self.Obj.translate(self.GetPosition()), options={"color":(0,127,127)})
+    def Show(self, position):
+        show_object(self.Placed(position), options={"color":(0,127,127)})
 
     def Export(self):
-        cq.exporters.export(self.Obj, ExportFolder+"KeyboardBase.stl")
+        ExportObj(self, F"Keyboard{self.Name}.stl")
 
 
-class KeyStop:
+class KeyStop(Part):
     Width = WallThickness*5
-    def __init__(self):
-
-        keystop = cq.Workplane().box(Base.Width+WallThickness*2, self.Width, WallThickness) \
-            .faces("<Z").workplane().move(Base.Width/2+WallThickness/2, 0) \
-            .rect(WallThickness, self.Width).mirrorY() \
-            .extrude(KeyCommon.Height)
+    #From and to where the legs at the seams reach in Y. They stand in the notches of the keys either side of the spacer,
+    #see KeyCommon.SpacerCut, in front of the spacer. The bottom of the notch swings back as the key goes down, by the
+    #most for the shortest key, a black key
+    Swing = KeyCommon.Height/2*KeyCommon.Travel/(KeyCommon.PivotPos.x+BlackKey.KeyBaseLength)
+    SeamPost = (KeyCommon.PivotPos.x-KeySpacer.WallSize-7.5+KeySpacer.Gap+Swing, KeyCommon.PivotPos.x-KeySpacer.WallSize-5-KeySpacer.Gap)
+    Name = "KeyStop"
+
+    #Spans the same span and ends as the piece of the base under it, see Base. It has a leg at each end, on the mount
+    #outside an end of the whole base or on the half post of the base piece at a seam
+    def __init__(self, obj=None, span=None, ends=(True, True), name=None):
+        self.Span = span if span is not None else Octave.Width
+        self.Ends = tuple(ends)
+        self.Name = name or self.Name
+        Part.__init__(self, obj)
+
+    def Build(self):
+        #From the middle of the span to each end of the bar
+        reach = [self.Span/2+Base.End+WallThickness if end else self.Span/2 for end in self.Ends]
+        keystop = cq.Workplane().box(sum(reach), self.Width, WallThickness).translate(((reach[1]-reach[0])/2, 0, 0))
+
+        #Both legs in a single boolean
+        legs = cq.Workplane("XY")
+        for side, end, length in zip((-1, 1), self.Ends, reach):
+            if end:
+                center, size = (side*(length-WallThickness/2), 0), (WallThickness, self.Width)
+            else:
+                front, back = self.SeamPost
+                center, size = (side*(length-KeySpacer.WallThick/4), (front+back-self.Width)/2), (KeySpacer.WallThick/2, back-front)
+            legs = legs.add(cq.Workplane("XY", origin=(0, 0, -WallThickness/2-KeyCommon.Height)).center(*center).rect(*size).extrude(KeyCommon.Height))
 
-        self.Obj = keystop
+        return keystop.union(legs)
 
+    def Params(self):
+        return {
+            "KeyStop.Width": self.Width,
+            "KeyStop.SeamPost": self.SeamPost,
+            "Base.Span": self.Span,
+            "Base.Ends": list(self.Ends),
+            "KeySpacer.WallThick": KeySpacer.WallThick,
+            "KeySpacer.Gap": KeySpacer.Gap,
+            "KeyCommon.Height": KeyCommon.Height,
+            "WallThickness": WallThickness,
+        }
 
-    def GetPosition(self):
-        return cq.Vector(Octave.Width/2, self.Width/2, KeyCommon.Height/2+WallThickness/2)
 
-    def Show(self):
-        show_object(self.Obj.translate(self.GetPosition()), options={"color":(50,127,127)})
+    def Show(self, position):
+        show_object(self.Placed(position), options={"color":(50,127,127)})
 
     def Export(self):
-        cq.exporters.export(self.Obj, ExportFolder+"KeyStop.stl")
-
-
-print()
-print("Runtime:")
+        ExportObj(self, F"{self.Name}.stl")
 
-t2 = time.time(); print(F"    Initialize:   {t2-t1:.6f}s")
 
-#= Octave =
-octave = Octave()
-octave.Show()
+#The shape moved to position without copying it. Repeated parts like the black keys and the spacers all share the
+#one shape, which CQ-editor also only meshes once, where translate would copy the whole shape for each of them
+def Instance(obj, position):
+    return cq.Workplane(obj=obj.val().moved(cq.Location(cq.Vector(position))))
 
-t3 = time.time(); print(F"    Octave:       {t3-t2:.6f}s")
-
-#= Base =
-base = Base()
-base.Show()
-
-t4 = time.time(); print(F"    Base:         {t4-t3:.6f}s")
-
-#= Spacers =
-spacer = KeySpacer()
-spacer.ShowKeySpacers(base)
-
-t5 = time.time(); print(F"    Spacers:      {t5-t4:.6f}s")
-
-#= SpringHolder =
-holder = SpringHolder()
-holder.Show()
-
-t6 = time.time(); print(F"    SpringHolder: {t6-t5:.6f}s")
+#Parts built once per octave alongside the keys, keyed by the name used in the reports
+Parts = {
+    "Base": Base,
+    "KeySpacer": KeySpacer,
+    "SpringHolder": SpringHolder,
+    "KeyStop": KeyStop,
+}
 
-#= KeyStop =
-keystop = KeyStop()
-keystop.Show()
+def MakePart(name, obj=None):
+    if name in Octave.KeyList:
+        return Octave.MakeKey(name, obj)
+    return Parts[name](obj)
+
+#The keys from first (in semitones from C0, see Layout.NoteIndex) on, and everything they sit in, placed with Layout.py.
+#The base is split into pieces of baseOctaves octaves on the spacer left of a C, each piece is built on its own and the
+#pieces are placed side by side instead of being fused. The same note in every octave is one part, and so are identical
+#base pieces, so the build only grows with the number of different pieces and not with the number of keys.
+#Every placement is (name, part, position)
+class Keyboard(object):
+    def __init__(self, first=0, count=12, baseOctaves=1):
+        self.Layout = Layout.KeyLayout(first, count, Octave.Width, Octave.KeySpacing, KeySpacer.WallThick, KeySpacer.Gap)
+        keys = self.Layout.Keys
+        mounts = self.Layout.MountPos[0]
+        widths = self.Layout.BaseWidths[0]
+
+        #Centers of the spacers either side of every key
+        lefts = (mounts - widths/2 - Octave.KeySpacing/2).tolist()
+        rights = (mounts + widths/2 + Octave.KeySpacing/2).tolist()
+        mounts = mounts.tolist()
+
+        #Keys are only named with their octave when there's more than one
+        octaves = keys[-1]//12 != keys[0]//12
+        self.Notes = {}
+        self.Keys = []
+        for i, key in enumerate(keys):
+            note = Layout.Notes[key%12]
+            if note not in self.Notes:
+                self.Notes[note] = Octave.MakeKey(note)
+            self.Keys.append((Layout.NoteName(key) if octaves else note, self.Notes[note], (WhiteKey.Width/2+float(self.Layout.KeyOffsets[0, i]), 0, 0)))
+
+        starts = [i for i, key in enumerate(keys) if i == 0 or (key%12 == 0 and (key//12-keys[0]//12) % baseOctaves == 0)]
+        stops = starts[1:] + [len(keys)]
+        #The key stop is split at the same seams, identical pieces of both are built once
+        pieces = {}
+        self.Bases = []
+        self.KeyStops = []
+        for n, (start, stop) in enumerate(zip(starts, stops)):
+            name = F"Base{n+1}" if len(starts) > 1 else "Base"
+            left = lefts[start]
+            #Rounded so the same piece in every octave has exactly the same parameters
+            base = Base(
+                span=round(rights[stop-1]-left, 9),
+                mounts=[round(mount-left, 9) for mount in mounts[start:stop]],
+                ends=(start == 0, stop == len(keys)),
+                name=name)
+            base = pieces.setdefault(Memo.Key("Base", base.Params()), base)
+            self.Bases.append((name, base, (left+base.Span/2, 0, -KeyCommon.Height/2-Base.Height/2-KeyCommon.Travel)))
+
+            name = F"KeyStop{n+1}" if len(starts) > 1 else "KeyStop"
+            keystop = KeyStop(span=base.Span, ends=base.Ends, name=name)
+            keystop = pieces.setdefault(Memo.Key("KeyStop", keystop.Params()), keystop)
+            self.KeyStops.append((name, keystop, (left+base.Span/2, KeyStop.Width/2, KeyCommon.Height/2+WallThickness/2)))
+
+        self.Spacer = KeySpacer()
+        self.Spacers = [(F"KeySpacer{i}", self.Spacer, (x, 0, -KeyCommon.Height/2-KeyCommon.Travel)) for i, x in enumerate([lefts[0], *rights])]
+
+        #In the spring hole of the first key
+        self.Holder = SpringHolder()
+        self.Holders = [("SpringHolder", self.Holder, (mounts[0]-(SpringHolder.SpringHoleDiam/2+0.5), KeyCommon.SpringPos, -KeyCommon.Travel-KeyCommon.Height/2-Base.Height))]
+
+    def Placements(self):
+        return self.Keys + self.Bases + self.Spacers + self.Holders + self.KeyStops
+
+    #The different parts, grouped the way the build reports them
+    def Groups(self):
+        return [
+            ("Keys", list(self.Notes.values())),
+            ("Base", list({id(base): base for _, base, _ in self.Bases}.values())),
+            ("Spacers", [self.Spacer]),
+            ("SpringHolder", [self.Holder]),
+            ("Keystop", list({id(keystop): keystop for _, keystop, _ in self.KeyStops}.values())),
+        ]
 
-t7 = time.time(); print(F"    Keystop:      {t7-t6:.6f}s")
+    def Parts(self):
+        return {PartName(part): part for _, parts in self.Groups() for part in parts}
 
-#= Export =
-octave.Export()
-base.Export()
-spacer.Export()
-holder.Export()
-keystop.Export()
+    #Show every placement of parts, or of every part
+    def Show(self, parts=None):
+        for name, part, position in self.Placements():
+            if parts is None or part in parts:
+                part.Show(position)
 
-#= Results =
-t8 = time.time(); print(F"    Export:       {t8-t7:.6f}s")
+#See Profiling.py, enabled by --profile and --memory
+Profile = Profiling.Profiler()
+Memory = Profiling.MemoryMonitor()
 
-print(F"    :: Total ::   {t8-t1:.6f}s")
-print()
+#Shapes built during this run, so parts with identical geometry are only built once.
+#Shapes are never modified in place, every translate/mirror makes a copy, so they can be shared
+class GeometryMemo(object):
+    def __init__(self):
+        self.Shapes = {}
+        self.Builds = 0
+        self.Reused = 0
+
+    #The Kernel options change the geometry too, see PartHash
+    @staticmethod
+    def Key(name, params):
+        return name, repr(sorted(params.items())), repr(Kernel.Settings())
+
+    def Get(self, name, params, build):
+        key = self.Key(name, params)
+        if key in self.Shapes:
+            self.Reused += 1
+        else:
+            self.Builds += 1
+            self.Shapes[key] = FinalShape(build()) if Lean else build()
+
+        return self.Shapes[key]
+
+    #Drop the shapes none of the parts still to come are built from, see Lean
+    def Release(self, remaining):
+        keys = {self.Key(type(part).__name__, part.Params()) for part in remaining}
+        depends = {cls.__name__ for part in remaining for cls in getattr(part, "Depends", [])}
+        for key in [key for key in self.Shapes if key not in keys and key[0] not in depends]:
+            del self.Shapes[key]
+
+    def Merge(self, stats):
+        self.Builds += stats[0]
+        self.Reused += stats[1]
+
+    def Stats(self):
+        return self.Builds, self.Reused
+
+Memo = GeometryMemo()
+
+#The shapes of the Workplane on their own, without the Workplanes it was built through and what they hold
+def FinalShape(obj):
+    return cq.Workplane().add(obj.vals())
+
+#Hash of everything the part's geometry depends on: its parameters, the code that builds it and the Kernel options
+def PartHash(part):
+    digest = hashlib.sha1()
+    digest.update(F"{CacheVersion}:{type(part).__name__}:{sorted(part.Params().items())!r}:{Kernel.Settings()!r}".encode())
+
+    for cls in [type(part)] + getattr(part, "Depends", []):
+        digest.update(SourceHash(cls).encode())
+
+    return digest.hexdigest()
+
+#Hash of the compiled code of the methods of the class and its plain constants. Unlike the source this is there in
+#CQ-editor too, and edits to comments or blank lines don't change it. The code can't change during a run
+@functools.lru_cache(maxsize=None)
+def SourceHash(cls):
+    digest = hashlib.sha1()
+    for name, value in sorted(vars(cls).items()):
+        #Not __module__, which depends on how the script was run
+        if name.startswith("__"):
+            continue
+        value = getattr(value, "__func__", getattr(value, "fget", value))
+        if inspect.isfunction(value):
+            digest.update(name.encode())
+            CodeHash(value.__code__, digest)
+        elif isinstance(value, (int, float, str, tuple)):
+            digest.update(F"{name}={value!r}".encode())
+    return digest.hexdigest()
+
+#The instructions, names and constants of code, and of the functions, lambdas and comprehensions inside it
+def CodeHash(code, digest):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            CodeHash(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+def PartName(part):
+    return getattr(part, "Key", None) or getattr(part, "Name", type(part).__name__)
+
+#Parameters calculated from other parameters, so a change can be traced to every part that uses it.
+#Tables like Octave.KeyBaseWidths are tracked as a whole, parts list the entries they read as eg. Octave.KeyBaseWidths[C]
+DerivedParams = {
+    "SpringHolder.SpringHoleDiam": ["SpringHolder.SpringDiameter"],
+    "KeyCommon.ExposedLength": ["KeyCommon.TotalLength", "KeyCommon.HiddenLength"],
+    "KeyCommon.SpringPos": ["KeyCommon.HiddenLength", "WallThickness", "SpringHolder.SpringHoleDiam"],
+    "WhiteKey.KeyBaseLength": ["KeyCommon.ExposedLength", "WhiteKey.ExtendedLength"],
+    "WhiteKey.Width": ["Octave.Width", "Octave.KeySpacing"],
+    "BlackKey.KeyBaseLength": ["WhiteKey.KeyBaseLength", "Octave.KeySpacing"],
+    "BlackKey.KeyBaseWidth": ["Octave.Width", "Octave.KeySpacing"],
+    "BlackKey.TopWidth": ["BlackKey.KeyBaseWidth"],
+    "BlackKey.TopLength": ["BlackKey.KeyBaseLength"],
+    "Base.Span": ["Octave.GlobalKeyMountPos", "Octave.KeyBaseWidths", "Octave.KeySpacing"],
+    "Base.Width": ["Base.Span", "KeySpacer.WallThick", "KeySpacer.Gap"],
+    "KeyStop.Width": ["WallThickness"],
+    "KeyStop.SeamPost": ["KeyCommon.PivotPos", "KeySpacer.WallSize", "KeySpacer.Gap", "KeyCommon.Height", "KeyCommon.Travel", "BlackKey.KeyBaseLength"],
+    "Octave.KeyOffsets": ["Octave.Width", "Octave.KeySpacing", "WhiteKey.Width", "BlackKey.KeyBaseWidth"],
+    "Octave.KeyBaseWidths": ["Octave.Width", "Octave.KeySpacing", "Octave.KeyOffsets", "BlackKey.KeyBaseWidth"],
+    "Octave.KeyBaseOffsets": ["WhiteKey.Width", "Octave.KeyBaseWidths", "Octave.KeyOffsets"],
+    "Octave.GlobalKeyMountPos": ["Octave.KeyOffsets", "Octave.KeyBaseOffsets", "WhiteKey.Width"],
+}
 
+#The parameter and everything derived from it
+def DerivedFrom(param):
+    derived = {param}
+    while True:
+        added = {name for name, sources in DerivedParams.items() if derived & set(sources)} - derived
+        if not added:
+            return derived
+        derived |= added
+
+def AffectedParts(param, parts):
+    derived = DerivedFrom(param)
+    return [PartName(part) for part in parts if derived & {name.split("[")[0] for name in part.Params()}]
+
+#Kept with the exports it describes, so separate export folders don't mix up each other's state
+State = Caching.BuildState(os.path.join(ExportFolder, "BuildState.json"))
+
+Cache = Caching.GeometryCache(Args.cache_dir, Args.cache_size*1024*1024) if Args.cache else None
+
+def BuildObj(part):
+    with Profile.Span(F"Part {PartName(part)}"):
+        obj = Memo.Get(type(part).__name__, part.Params(), lambda: BuildCached(part))
+    RecordPart(part)
+    return obj
+
+#What the part is built from, and how long the build took when it really was built and not loaded
+def RecordPart(part, buildtime=None):
+    State.Record(PartName(part), PartHash(part), part.Params(), buildtime)
+
+def BuildCached(part):
+    digest = PartHash(part)
+    if digest not in WarmShapes:
+        WarmShapes[digest] = LoadOrBuild(part)
+    return WarmShapes[digest]
+
+def LoadOrBuild(part):
+    Kernel.Apply()
+    if Cache is None:
+        start = time.time()
+        obj = part.Build()
+        RecordPart(part, time.time()-start)
+        return obj
+
+    brep = Cache.Load(PartHash(part))
+    if brep is not None:
+        return BrepToShape(brep)
+
+    start = time.time()
+    obj = part.Build()
+    RecordPart(part, time.time()-start)
+    Cache.Store(PartHash(part), type(part).__name__, ShapeToBrep(obj), time.time()-start)
+    return obj
+
+def ShapeToBrep(obj):
+    brep = io.BytesIO()
+    obj.val().exportBrep(brep)
+    return brep.getvalue()
+
+def BrepToShape(brep):
+    return cq.Workplane(obj=cq.Shape.importBrep(io.BytesIO(brep)))
+
+def BuildWorker(part):
+    cacheStats = Cache.Stats() if Cache is not None else (0, 0, 0)
+    memoStats = Memo.Stats()
+
+    start = time.time()
+    with Memory.Span(PartName(part)):
+        brep = ShapeToBrep(part.Obj)
+    buildtime = time.time()-start
+
+    #Send back only the counts from this part, the worker may be reused for others
+    if Cache is not None:
+        cacheStats = tuple(a-b for a, b in zip(Cache.Stats(), cacheStats))
+    memoStats = tuple(a-b for a, b in zip(Memo.Stats(), memoStats))
+
+    return brep, buildtime, cacheStats, memoStats, Profile.Take(), Memory.Take()
+
+#Builds the parts, in the order given, and shows and exports each as soon as it's back, so Lean can let go of it there
+def BuildParallel(parts, jobs, keyboard):
+    #Fork so the workers inherit the layout tables instead of re-running this script
+    context = multiprocessing.get_context("fork")
+
+    #Only send one of each set of identical parts to the workers
+    groups = {}
+    for part in parts:
+        groups.setdefault(Memo.Key(type(part).__name__, part.Params()), []).append(part)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs, mp_context=context) as pool:
+        futures = {pool.submit(BuildWorker, group[0]): key for key, group in groups.items()}
+        pending = set(futures.values())
+        for future in concurrent.futures.as_completed(futures):
+            brep, buildtime, cacheStats, memoStats, events, memory = future.result()
+            Profile.Events += events
+            Memory.Parts.update(memory)
+            group = groups[futures[future]]
+            pending.remove(futures[future])
+
+            Memo.Shapes[futures[future]] = BrepToShape(brep)
+            Memo.Merge(memoStats)
+            Memo.Reused += len(group)-1
+            if Cache is not None:
+                Cache.Merge(cacheStats)
+
+            for part in group:
+                part.Built = Memo.Shapes[futures[future]]
+                WarmShapes[PartHash(part)] = part.Obj
+                #Only a real build says anything about what the part costs, not a cache load
+                RecordPart(part, buildtime if cacheStats[1] > 0 or Cache is None else None)
+                part.Export()
+            keyboard.Show(group)
+            if Lean:
+                ReleaseParts(group, [part for key in pending for part in groups[key]])
+            print(F"        {', '.join(PartName(part) for part in group)+':':13} {buildtime:.6f}s")
+
+#Neither the shapes built so far nor the ones kept between builds are used again, for timing the builds from scratch
+def ForgetShapes():
+    Memo.Shapes.clear()
+    WarmShapes.clear()
+
+#Lets go of the parts that are exported and of the shapes no part in remaining is built from, see Lean
+def ReleaseParts(done, remaining):
+    for part in done:
+        part.Built = None
+        WarmShapes.pop(PartHash(part), None)
+    Memo.Release(remaining)
+
+#Tessellating is most of the time of an export, so the mesh is cached with the shape under the part's hash
+def ExportMesh(obj, digest=None):
+    mesh = Cache.LoadMesh(digest, ExportTolerance, ExportAngularTolerance) if Cache is not None and digest else None
+    if mesh is None:
+        mesh = Mesh.Mesh.FromShape(obj.val(), ExportTolerance, ExportAngularTolerance, relative=True)
+        if Cache is not None and digest:
+            Cache.StoreMesh(digest, mesh, ExportTolerance, ExportAngularTolerance)
+
+    return mesh
+
+#A cached mesh is written from its arrays in one go. Otherwise OCCT tessellates the part and writes the STL itself,
+#which is as fast as cq.exporters.export, and the mesh is only read back from the file when it's to be cached
+def ExportSTL(obj, path, digest=None):
+    caching = Cache is not None and digest
+    mesh = Cache.LoadMesh(digest, ExportTolerance, ExportAngularTolerance) if caching else None
+    if mesh is not None:
+        return Mesh.WriteSTL(path, [(mesh, (0,0,0))])
+
+    size = Mesh.WriteShapeSTL(path, obj.val(), ExportTolerance, ExportAngularTolerance, relative=True)
+    if caching:
+        Cache.StoreMesh(digest, Mesh.Mesh.FromSTL(path), ExportTolerance, ExportAngularTolerance)
+    return size
+
+#The STL is written next to the file and only replaces it when its content hash differs from previous, so a part whose
+#hash changed without changing its geometry, eg. after an edit to a comment, keeps its file and mtime.
+#Returns (filename, time, size, content hash, written)
+def WriteExport(obj, filename, digest=None, previous=None):
+    start = time.time()
+    path = ExportFolder+filename
+    ExportSTL(obj, path+".tmp", digest)
+    with open(path+".tmp", "rb") as f:
+        content = hashlib.sha1(f.read()).hexdigest()
+
+    written = content != previous
+    if written:
+        os.replace(path+".tmp", path)
+    else:
+        os.remove(path+".tmp")
+    return filename, time.time()-start, os.path.getsize(path), content, written
+
+def ExportWorker(brep, filename, digest, previous):
+    return WriteExport(BrepToShape(brep), filename, digest, previous)
+
+#Exports are started as soon as each part is built, tessellating and writing in the background
+class ExportPipeline(object):
+    def __init__(self, jobs):
+        self.Pool = None
+        if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+            self.Pool = concurrent.futures.ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("fork"))
+
+        self.Pending = []
+        self.Results = []
+        self.Unchanged = []
+
+    def Submit(self, obj, filename, digest=None, previous=None):
+        os.makedirs(ExportFolder, exist_ok=True)
+        if self.Pool is None:
+            with Profile.Span(F"Export {filename}"):
+                self.Results.append(WriteExport(obj, filename, digest, previous))
+        else:
+            self.Pending.append(self.Pool.submit(ExportWorker, ShapeToBrep(obj), filename, digest, previous))
+
+    def Wait(self):
+        for future in self.Pending:
+            self.Results.append(future.result())
+        self.Pending = []
+
+        if self.Pool is not None:
+            self.Pool.shutdown()
+            self.Pool = None
+
+        return self.Results
+
+Exporter = ExportPipeline(Args.export_jobs if Args.export_jobs is not None else Args.jobs)
+
+#Size and mtime of the file as a list, the way it's stored in the manifest, or None when there is no file
+def FileStamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+#Parts that haven't changed since they were last exported are left alone. Whether the file is still the one written
+#then is told from its size and mtime, so checking even hundreds of files reads none of them
+def ExportObj(part, filename):
+    if Draft:
+        return
+
+    digest = PartHash(part)
+    entry = State.Exports.get(filename)
+    #Anything else is from before the manifest, or the file was changed or removed since
+    current = isinstance(entry, dict) and FileStamp(ExportFolder+filename) == entry["Stamp"]
+
+    if not Args.export_all and current and entry["Part"] == digest:
+        Exporter.Unchanged.append(filename)
+        return
+
+    Exporter.Submit(part.Obj, filename, digest, entry["Hash"] if current and not Args.export_all else None)
+    State.Exports[filename] = {"Part": digest, "Params": json.loads(json.dumps(part.Params()))}
+
+#Completes the manifest with the files written this run, and writes what changed to ExportChanges for the tools that
+#process the files further. Files in the manifest the build didn't export, like the base pieces of a larger keyboard
+#built before, are dropped from it and listed as removed, the files themselves are left alone.
+#Returns (changed, removed)
+def RecordExports(exports):
+    changed = []
+    for filename, exporttime, size, content, written in exports:
+        State.Exports[filename].update({"Hash": content, "Stamp": FileStamp(ExportFolder+filename)})
+        (changed if written else Exporter.Unchanged).append(filename)
+
+    removed = sorted(set(State.Exports) - set(changed) - set(Exporter.Unchanged))
+    for filename in removed:
+        del State.Exports[filename]
+
+    os.makedirs(ExportFolder, exist_ok=True)
+    with open(ExportFolder+ExportChanges, "w") as f:
+        json.dump({
+            "Changed": {filename: State.Exports[filename]["Hash"] for filename in changed},
+            "Unchanged": sorted(Exporter.Unchanged),
+            "Removed": removed,
+        }, f, indent=4)
+
+    return changed, removed
+
+#Nothing is built, only the parameters are needed
+def PrintPlan(parts):
+    changed = [part for part in parts if State.Changed(PartName(part), PartHash(part))]
+
+    print()
+    print("Rebuild plan:")
+
+    params = {}
+    for part in changed:
+        previous = State.Parts.get(PartName(part), {}).get("Params", {})
+        for name, value in json.loads(json.dumps(part.Params())).items():
+            if name in previous and previous[name] != value:
+                params[name] = (previous[name], value)
+
+    for name, (previous, value) in sorted(params.items()):
+        print(F"    {name}: {previous} -> {value}")
+    for part in changed:
+        if PartName(part) not in State.Parts:
+            print(F"    {PartName(part)}: not built before")
+        elif not any(name in params for name in part.Params()):
+            print(F"    {PartName(part)}: code changed")
+
+    #Parts with identical geometry are only built once, by whichever of them comes first
+    groups = {}
+    for part in changed:
+        groups.setdefault(PartHash(part), []).append(State.Parts.get(PartName(part), {}).get("BuildTime", 0))
+    estimate = sum(max(times) for times in groups.values())
+
+    print(F"    Rebuild:      {', '.join(PartName(part) for part in changed) or '-'}")
+    print(F"    Unchanged:    {', '.join(PartName(part) for part in parts if part not in changed) or '-'}")
+    print(F"    Estimate:     {estimate:.6f}s")
+    print()
+
+def PrintAffected(params, parts):
+    print()
+    for param in params:
+        print(F"{param}:")
+        print(F"    Derived:      {', '.join(sorted(DerivedFrom(param) - {param})) or '-'}")
+        print(F"    Rebuild:      {', '.join(AffectedParts(param, parts)) or '-'}")
+    print()
+
+#Every part of the assembly as (name, shape, position), repeated parts like the black keys share the same shape
+def AssemblyParts(keyboard):
+    shapes = {}
+    parts = []
+    for name, part, position in keyboard.Placements():
+        if id(part) not in shapes:
+            shapes[id(part)] = part.Oriented().val()
+        parts.append((name, shapes[id(part)], cq.Vector(position)))
+
+    return parts
+
+#Every part placed where it sits in the assembly, as shown in CQ-editor
+def Assembly(keyboard):
+    return [(name, shape.moved(cq.Location(position))) for name, shape, position in AssemblyParts(keyboard)]
+
+#Write the parts to one 3MF or STEP file in the export folder. Each shape is stored once and placed by every part using it.
+#names picks parts by name, KeySpacer picks all the spacers
+def ExportAssembly(parts, filename, names=None):
+    if names:
+        parts = [part for part in parts if part[0] in names or part[0].rstrip("0123456789") in names]
+
+    os.makedirs(ExportFolder, exist_ok=True)
+    path = ExportFolder+filename
+    extension = os.path.splitext(filename)[1].lower()
+
+    shapes = {}
+    for name, shape, position in parts:
+        shapes.setdefault(id(shape), (name.rstrip("0123456789"), shape))
+
+    if extension in (".3mf", ".stl"):
+        #Same tolerances as the STL export
+        meshes = {key: (name, Mesh.Mesh.FromShape(shape, ExportTolerance, ExportAngularTolerance, relative=True)) for key, (name, shape) in shapes.items()}
+    if extension == ".3mf":
+        index = {key: i for i, key in enumerate(meshes)}
+        Mesh.Write3MF(path, list(meshes.values()), [(index[id(shape)], Mesh.Placement(position.toTuple()), name) for name, shape, position in parts])
+    elif extension == ".stl":
+        #STL can't reference a mesh, every part gets its own copy of the triangles
+        Mesh.WriteSTL(path, [(meshes[id(shape)][1], position.toTuple()) for name, shape, position in parts])
+    elif extension in (".step", ".stp"):
+        #The assembly stores a shape added more than once as one part with several locations
+        assembly = cq.Assembly(name="Keyboard")
+        for name, shape, position in parts:
+            assembly.add(shape, name=name, loc=cq.Location(position))
+        assembly.export(path)
+    else:
+        raise ValueError(F"Can't export an assembly to {filename}, use .3mf, .step or .stl")
+
+    return path, len(parts), len(shapes)
+
+#Every part that gets printed, once for each copy needed: a spacer for every spacer position and a spring holder per key
+def PrintedParts(keyboard):
+    parts = [part for _, part, _ in keyboard.Keys + keyboard.Spacers]
+    parts += [keyboard.Holder]*len(keyboard.Keys)
+    parts += [part for _, part, _ in keyboard.Bases + keyboard.KeyStops]
+
+    return parts
+
+#Pack the printed parts onto build plates of bed (width, depth) and write a 3MF per plate, with each shape stored once
+def ExportPlates(parts, bed, gap):
+    meshes = {}
+    for part in parts:
+        if id(part) not in meshes:
+            mesh = ExportMesh(part.Obj, PartHash(part))
+            meshes[id(part)] = (PartName(part), mesh, *Mesh.Bounds(mesh.Vertices))
+    sizes = [tuple(meshes[id(part)][3][:2]-meshes[id(part)][2][:2]) for part in parts]
+
+    start = time.time()
+    placed = Plates.Pack(sizes, bed, gap)
+    packtime = time.time()-start
+
+    plates = {}
+    misfits = {}
+    for part, place in zip(parts, placed):
+        if place is None:
+            misfits[PartName(part)] = misfits.get(PartName(part), 0)+1
+            continue
+        plate, x, y, turned = place
+        name, mesh, low, high = meshes[id(part)]
+
+        #Put the corner of the footprint at x, y with the bottom on the bed, turning it a quarter about Z first
+        if turned:
+            low, high = (-high[1], low[0], low[2]), (-low[1], high[0], high[2])
+        plates.setdefault(plate, []).append((id(part), Mesh.Placement((x-low[0], y-low[1], -low[2]), math.pi/2 if turned else 0), name))
+
+    for name, count in misfits.items():
+        print(F"{name} doesn't fit on a {bed[0]:g}x{bed[1]:g} bed" + (F" ({count} copies)" if count > 1 else ""))
+
+    os.makedirs(ExportFolder, exist_ok=True)
+    for name in os.listdir(ExportFolder):
+        if name.startswith("Plate") and name.endswith(".3mf"):
+            os.remove(ExportFolder+name)
+
+    files = []
+    for plate, items in sorted(plates.items()):
+        filename = F"Plate{plate+1}.3mf"
+        #Only the meshes placed on this plate, numbered in the order they first appear on it
+        used = {key: number for number, key in enumerate(dict.fromkeys(key for key, _, _ in items))}
+        Mesh.Write3MF(ExportFolder+filename, [meshes[key][:2] for key in used],
+            [(used[key], placement, name) for key, placement, name in items])
+        files.append((filename, len(items)))
+
+    return files, Plates.Fill(sizes, placed, bed), packtime
+
+def PrintPlates(parts, bed, gap):
+    start = time.time()
+    files, fill, packtime = ExportPlates(parts, bed, gap)
+
+    print(F"Plates ({bed[0]:g}x{bed[1]:g}mm):")
+    for (filename, count), share in zip(files, fill):
+        print(F"    {filename+':':18}{count:3} parts {share*100:5.1f}%")
+    print(F"    Packing:      {packtime:.6f}s")
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+def PrintAssembly(parts, filename, names):
+    start = time.time()
+    path, count, unique = ExportAssembly(parts, filename, names)
+
+    print("Assembly:")
+    print(F"    File:         {path}")
+    print(F"    Parts:        {count}")
+    print(F"    Shapes:       {unique}")
+    print(F"    Size:         {os.path.getsize(path)/1024:.1f}kB")
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+#Pairs of shapes whose bounding boxes overlap. Sweeping along X means each box is only compared with the
+#boxes it overlaps in X, instead of with every other box
+def OverlappingBoxes(boxes):
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i].xmin)
+
+    pairs = []
+    active = []
+    for i in order:
+        active = [j for j in active if boxes[j].xmax > boxes[i].xmin]
+        for j in active:
+            if boxes[i].ymin < boxes[j].ymax and boxes[j].ymin < boxes[i].ymax \
+                and boxes[i].zmin < boxes[j].zmax and boxes[j].zmin < boxes[i].zmax:
+                pairs.append((j, i))
+        active.append(i)
+
+    return pairs
+
+#Only the pairs with overlapping bounding boxes go through the exact, slow, boolean intersection
+def CheckInterference(placed):
+    boxes = [shape.BoundingBox() for _, shape in placed]
+    candidates = OverlappingBoxes(boxes)
+
+    overlaps = []
+    for i, j in candidates:
+        volume = placed[i][1].intersect(placed[j][1]).Volume()
+        if volume > InterferenceTolerance:
+            overlaps.append((placed[i][0], placed[j][0], volume))
+
+    return candidates, overlaps
+
+def PrintInterference(placed):
+    start = time.time()
+    candidates, overlaps = CheckInterference(placed)
+
+    print("Interference:")
+    print(F"    Parts:        {len(placed)}")
+    print(F"    Candidates:   {len(candidates)} of {len(placed)*(len(placed)-1)//2} pairs")
+    for a, b, volume in overlaps:
+        print(F"    {a} / {b}: {volume:.3f}mm^3")
+    if not overlaps:
+        print("    No overlaps")
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+    return overlaps
+
+#Signed clearance of the key points to the part and of the part points to the key, rotated by angle about the pivot.
+#Returns the points the clearances were measured at, in the frame of the assembly, and the clearances
+def Clearance(points, corners, part, partPoints, pivot, angle):
+    moved = Mesh.Rotate(points, pivot, (1,0,0), angle)
+    near = Mesh.PointsNear(moved, Mesh.Bounds(partPoints), TravelMargin)
+    keySide = Mesh.SignedDistance(near, part, TravelMargin)
+
+    #The part is measured against the key as tessellated, by rotating it the other way
+    partNear = Mesh.PointsNear(partPoints, Mesh.Bounds(moved), TravelMargin)
+    partSide = Mesh.SignedDistance(Mesh.Rotate(partNear, pivot, (1,0,0), -angle), corners, TravelMargin)
+
+    return np.concatenate([near, partNear]), np.concatenate([keySide, partSide])
+
+#Rotate every key about the pivot from rest until its front has moved down by KeyCommon.Travel,
+#and measure the clearance to the key spacers, the base and the key stop at each step.
+#Every part is tessellated once, the steps only rotate the points with NumPy instead of running OCCT booleans.
+#The key rests on the pivot, so contact within TravelPivot of it is kept apart from the rest of the base
+def SimulateTravel(keyboard, steps):
+    meshes = {}
+    def Tessellate(obj, position):
+        shape = obj.val()
+        if id(shape) not in meshes:
+            meshes[id(shape)] = Mesh.Mesh.FromShape(shape)
+        return meshes[id(shape)].Translated(position)
+
+    parts = {
+        "KeySpacer": [Tessellate(part.Obj, pos) for _, part, pos in keyboard.Spacers],
+        "Base": [Tessellate(part.Obj, pos) for _, part, pos in keyboard.Bases],
+        "KeyStop": [Tessellate(part.Obj, pos) for _, part, pos in keyboard.KeyStops],
+    }
+    parts = {
+        name: (np.concatenate([mesh.Corners() for mesh in meshList]), np.concatenate([mesh.EdgePoints(TravelSpacing) for mesh in meshList]))
+        for name, meshList in parts.items()
+    }
+
+    pivot = np.array([0, KeyCommon.PivotPos.x, KeyCommon.PivotPos.y])
+    results = {}
+    for keyName, key, position in keyboard.Keys:
+        mesh = Tessellate(key.Obj, position)
+        corners = mesh.Corners()
+        points = mesh.EdgePoints(TravelSpacing)
+
+        travel = math.asin(KeyCommon.Travel / (KeyCommon.PivotPos.x - mesh.Vertices[:, 1].min()))
+        angles = np.linspace(0, travel, steps+1)
+
+        clearances = []
+        for angle in angles:
+            clearance = {}
+            for name, (part, partPoints) in parts.items():
+                at, distance = Clearance(points, corners, part, partPoints, pivot, angle)
+                if name == "Base":
+                    bearing = np.hypot(at[:, 1]-pivot[1], at[:, 2]-pivot[2]) <= TravelPivot
+                    clearance["Pivot"] = distance[bearing].min(initial=np.inf)
+                    distance = distance[~bearing]
+                clearance[name] = distance.min(initial=np.inf)
+            clearances.append(clearance)
+
+        #The key rests against the key stop, so contact is only looked for once it starts moving
+        contact = None
+        for angle, clearance in zip(angles[1:], clearances[1:]):
+            touching = [name for name, value in clearance.items() if value < (-TravelContact if name == "Pivot" else TravelContact)]
+            if touching:
+                contact = (math.degrees(angle), touching)
+                break
+
+        results[keyName] = {"Angles": np.degrees(angles), "Clearance": clearances, "Contact": contact}
+
+    return results
+
+def PrintTravel(keyboard, steps):
+    start = time.time()
+    results = SimulateTravel(keyboard, steps)
+
+    print(F"Key travel ({steps} steps, clearance in mm, over {TravelMargin} shown as -):")
+    print(F"    {'Key':6}{'Travel':>8}" + "".join(F"{F'{step*100//steps}%':>7}" for step in range(steps+1)) + F"{'Pivot':>8}   Contact")
+    for name, result in results.items():
+        row = ""
+        for clearance in result["Clearance"]:
+            closest = min(value for part, value in clearance.items() if part != "Pivot")
+            row += F"{closest:7.2f}" if closest <= TravelMargin else F"{'-':>7}"
+        pivot = min(clearance["Pivot"] for clearance in result["Clearance"])
+
+        contact = F"{result['Contact'][0]:.2f}deg {', '.join(result['Contact'][1])}" if result["Contact"] else "none"
+        print(F"    {name:6}{result['Angles'][-1]:7.2f}d" + row + F"{pivot:8.2f}   " + contact)
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+    return results
+
+#Builds every part with CadQuery's own boolean options and with the ones set in Kernel, runs times each.
+#Returns {name: (time with CadQuery's, time with Kernel's, valid, volume change)}, or an error instead of the change
+def CheckKernel(parts, runs):
+    Kernel.Apply()
+
+    results = {}
+    for name, part in parts.items():
+        built = []
+        for settings in [Kernel.Defaults, Kernel.Settings()]:
+            times = []
+            with Kernel.Using(settings):
+                for i in range(runs):
+                    #Build the shared shapes like KeyCommon every time too, not only on the first run
+                    Memo.Shapes.clear()
+                    start = time.perf_counter()
+                    try:
+                        obj = part.Build()
+                    except Exception as e:
+                        obj = e
+                        break
+                    times.append(time.perf_counter()-start)
+            built.append((statistics.median(times) if times else math.nan, obj))
+
+        (before, reference), (after, obj) = built
+        if isinstance(obj, Exception):
+            results[name] = (before, after, False, F"{type(obj).__name__}: {obj}")
+        else:
+            results[name] = (before, after, obj.val().isValid(), obj.val().Volume()-reference.val().Volume())
+
+    return results
+
+#Returns the names of the parts that are invalid or changed with Kernel's options
+def PrintKernelCheck(parts, runs):
+    results = CheckKernel(parts, runs)
+
+    print()
+    print(F"Kernel ({', '.join(F'{name}={value}' for name, value in Kernel.Settings().items())}, {runs} runs):")
+    print(F"    {'':14}{'CadQuery':>11}{'Kernel':>11}{'Change':>9}{'Valid':>7}{'Volume':>14}")
+    failed = []
+    for name, (before, after, valid, change) in results.items():
+        volume = parts[name].Obj.val().Volume()
+        changed = isinstance(change, str) or abs(change) > KernelVolumeTolerance*volume
+        if changed or not valid:
+            failed.append(name)
+        print(F"    {name+':':14}{before:10.6f}s{after:10.6f}s{(after/before-1)*100:+8.1f}%{'yes' if valid else 'NO':>7}"
+            + (F"  {change}" if isinstance(change, str) else F"{change:+13.6f}{'  CHANGED' if changed else ''}"))
+
+    before = sum(result[0] for result in results.values())
+    after = sum(result[1] for result in results.values())
+    print(F"    {':: Total ::':14}{before:10.6f}s{after:10.6f}s{(after/before-1)*100:+8.1f}%")
+    print()
+
+    return failed
+
+#The concave corners along the MillAxis of every part and which of them are tighter than the bit reaches, see Milling.py.
+#Returns {name: (radii, places, tight)}
+def CheckMilling(parts):
+    results = {}
+    for name, part in parts.items():
+        radii, places = Milling.ConcaveCorners(part.Obj.val(), part.MillAxis)
+        results[name] = (radii, places, radii < BitSize/2-MillTolerance)
+    return results
+
+def PrintMilling(parts):
+    start = time.time()
+    results = CheckMilling(parts)
+
+    print(F"Milling (concave corners under the {BitSize/2}mm radius of the bit):")
+    print(F"    {'':14}{'Axis':>10}{'Concave':>8}{'Sharp':>7}{'Tight':>7}{'Tightest':>10}   First tight corner")
+    for name, (radii, places, tight) in results.items():
+        axis = ",".join(F"{value:g}" for value in parts[name].MillAxis)
+        first = F"({', '.join(F'{value:.2f}' for value in places[tight][0])})" if tight.any() else "-"
+        tightest = F"{radii.min():8.3f}mm" if len(radii) else F"{'-':>10}"
+        print(F"    {name+':':14}{axis:>10}{len(radii):8}{(radii == 0).sum():7}{tight.sum():7}{tightest}   {first}")
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+    return results
+
+#Nothing is built, the fits are sampled with Layout.Tolerance
+def PrintTolerance(keyboard, samples, gaps=None):
+    layout = keyboard.Layout
+    keys = [name for name, _, _ in keyboard.Keys]
+    percent = lambda share: F"{share*100:8.2f}%"
+
+    start = time.time()
+    result = Layout.Tolerance(layout, samples, PrintSigma, PrintBias, WobbleLimit, SpringHolder.Gap)
+
+    print()
+    print(F"Tolerance ({samples} samples, printed sizes off by {PrintBias}+-{PrintSigma}mm, wobble over {WobbleLimit}mm):")
+    print(F"    {'':14}{'Nominal':>8}{'Mean':>8}{'Std':>8}{'Bind':>9}{'Wobble':>9}")
+    rows = [(key, *(result[name][i] for name in ["Nominal", "Mean", "Std", "Bind", "Wobble"])) for i, key in enumerate(keys)]
+    rows.append(("SpringHolder", *(result["Holder"][name] for name in ["Nominal", "Mean", "Std", "Bind", "Wobble"])))
+    for name, nominal, mean, std, bind, wobble in rows:
+        print(F"    {name+':':14}{nominal:8.3f}{mean:8.3f}{std:8.3f}{percent(bind)}{percent(wobble)}")
+    print(F"    Any key:      {'':24}{percent(result['AnyBind'])}{percent(result['AnyWobble'])}")
+    print(F"    Time:         {time.time()-start:.6f}s")
+    print()
+
+    if gaps:
+        #Every gap is a variant of the layout, the notches get wider with the gap
+        variants = Layout.KeyLayout(layout.Keys[0], len(layout.Keys), Octave.Width, Octave.KeySpacing, KeySpacer.WallThick, gaps)
+
+        print(F"Gaps (KeySpacer.Gap and SpringHolder.Gap, worst key and any key):")
+        print(F"    {'Gap':8}{'Bind':>9}{'Wobble':>9}{'Any bind':>10}{'Any wobble':>11}{'Holder bind':>13}{'wobble':>9}")
+        for variant, gap in enumerate(gaps):
+            result = Layout.Tolerance(variants, samples, PrintSigma, PrintBias, WobbleLimit, gap, variant)
+            print(F"    {gap:<8g}{percent(result['Bind'].max())}{percent(result['Wobble'].max())}"
+                + F"{percent(result['AnyBind']):>10}{percent(result['AnyWobble']):>11}"
+                + F"{percent(result['Holder']['Bind']):>13}{percent(result['Holder']['Wobble'])}")
+        print()
+
+    return result
+
+#The keyboard the command line asks for, one octave from C0 by default
+def MakeKeyboard(args):
+    if args.range:
+        first, last = [Layout.NoteIndex(note) for note in args.range.split("-", 1)]
+        return Keyboard(first, last-first+1, args.base_octaves)
+    return Keyboard(0, 12*args.octaves, args.base_octaves)
+
+#Builds, shows and exports every different part the way running the script does, and returns them by name.
+#Importing this file builds nothing
+def main(argv=None):
+    global Args, Draft, Lean, Cache, Exporter
+    Args = Parser.parse_args(argv)
+    Draft = Draft or Args.draft
+    Lean = Lean or Args.lean
+    for name, value in Args.kernel:
+        setattr(Kernel, name, value)
+    Cache = Caching.GeometryCache(Args.cache_dir, Args.cache_size*1024*1024) if Args.cache else None
+    Exporter = ExportPipeline(Args.export_jobs if Args.export_jobs is not None else Args.jobs)
+
+    if Args.benchmark or Args.benchmark_save:
+        #Time the geometry itself, never load it from the cache
+        Cache = None
+        Kernel.Apply()
+        #The names defined here, also when CQ-editor runs this script without it being a module
+        results = Benchmark.Run(Benchmark.Cases(types.SimpleNamespace(**globals())), Args.benchmark_runs, ForgetShapes)
+
+        if Args.benchmark_save:
+            with open(Args.benchmark_file, "w") as f:
+                json.dump({"Runs": Args.benchmark_runs, "Results": results}, f, indent=4)
+            print(F"Baseline saved to {Args.benchmark_file}")
+            print()
+            sys.exit()
+
+        try:
+            with open(Args.benchmark_file) as f:
+                baseline = json.load(f)["Results"]
+        except (OSError, ValueError, KeyError):
+            #Nothing to compare with is a failed check, not a passed one
+            print(F"No baseline in {Args.benchmark_file}, save one with --benchmark-save")
+            print()
+            sys.exit(1)
+
+        regressed = Benchmark.Compare(results, baseline, Args.benchmark_threshold)
+        if regressed:
+            print(F"Slower than the baseline by more than {Args.benchmark_threshold*100:.0f}%: {', '.join(regressed)}")
+            print()
+            sys.exit(1)
+        sys.exit()
+
+    if Args.profile:
+        Profile.Enable([Octave, SpringHolder, KeyCommon, WhiteKey, BlackKey, KeySpacer, Base, KeyStop])
+
+    keyboard = MakeKeyboard(Args)
+    parts = keyboard.Parts()
+
+    if Args.plan:
+        PrintPlan(list(parts.values()))
+        sys.exit()
+
+    if Args.affected:
+        PrintAffected(Args.affected, list(parts.values()))
+        sys.exit()
+
+    if Args.tolerance or Args.tolerance_gaps:
+        PrintTolerance(keyboard, Args.tolerance or 1000000, Args.tolerance_gaps)
+        sys.exit()
+
+    #Load OCCT up front so it counts towards the initialisation, not the first part
+    importlib.import_module("cadquery")
+
+    #After CadQuery, tracing its import would take longer than the build
+    if Args.memory or Args.memory_budget:
+        Memory.Enable()
+
+    if Args.kernel_check:
+        if Kernel.Settings() == Kernel.Defaults:
+            print("Kernel options are all CadQuery's own, nothing to check. Set some with --kernel NAME=VALUE")
+            print()
+            sys.exit()
+        failed = PrintKernelCheck(parts, Args.benchmark_runs)
+        if failed:
+            print(F"Invalid or changed with the Kernel options: {', '.join(failed)}")
+            print()
+        sys.exit(1 if failed else 0)
+
+    print()
+    print("Runtime:")
+
+    t2 = time.time(); print(F"    Initialize:   {t2-t1:.6f}s")
+
+    if Args.jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+        #= Parallel build =
+        #Slowest parts first so they aren't left running alone at the end
+        print(F"    Build ({Args.jobs} jobs):")
+        BuildParallel(sorted(parts.values(), key=lambda part: not isinstance(part, Base)), Args.jobs, keyboard)
+
+        t7 = time.time(); print(F"    Build:        {t7-t2:.6f}s")
+
+    else:
+        #= Keys, Base, Spacers, SpringHolder, KeyStop =
+        t7 = t2
+        remaining = list(parts.values())
+        for group, groupParts in keyboard.Groups():
+            for part in groupParts:
+                with Memory.Span(PartName(part)):
+                    keyboard.Show([part])
+                    part.Export()
+                    remaining.remove(part)
+                    if Lean:
+                        ReleaseParts([part], remaining)
+
+            t7, start = time.time(), t7
+            print(F"    {group+':':14}{t7-start:.6f}s")
+
+    #= Export =
+    #Each part was queued for export as it was built, wait for the rest to finish
+    exports = Exporter.Wait()
+
+    #= Results =
+    t8 = time.time(); print(F"    Export:       {t8-t7:.6f}s")
+
+    print(F"    :: Total ::   {t8-t1:.6f}s")
+    print()
+
+    print("Export:")
+    if Draft:
+        print("    Draft build, nothing exported")
+    else:
+        changed, removed = RecordExports(exports)
+        for filename, exporttime, size, content, written in exports:
+            print(F"    {filename+':':17} {exporttime:.6f}s  {size/1024:8.1f}kB{'' if written else '  same content, kept'}")
+        print(F"    :: Written :: {sum(size for _, _, size, _, written in exports if written)/1024:.1f}kB")
+        print(F"    Changed:      {len(changed)} files")
+        print(F"    Unchanged:    {len(Exporter.Unchanged)} files")
+        if removed:
+            print(F"    Removed:      {', '.join(removed)}")
+        print(F"    Changes saved to {ExportFolder+ExportChanges}")
+    print()
+
+    #A draft doesn't change what the next full build has to rebuild
+    if not Draft:
+        State.Save()
+
+    over = []
+    if Memory.Enabled:
+        budget = Args.memory_budget*1024**2 if Args.memory_budget else None
+        over = Memory.Print(budget)
+
+    if Args.check:
+        PrintInterference(Assembly(keyboard))
+
+    if (Args.assembly or Args.plates) and Draft:
+        print("Draft build, the assembly and plates are only written by a full build")
+        print()
+    elif Args.assembly:
+        PrintAssembly(AssemblyParts(keyboard), Args.assembly, Args.assembly_parts)
+
+    if Args.plates and not Draft:
+        PrintPlates(PrintedParts(keyboard), Args.bed, Args.plate_gap)
+
+    if Args.mill:
+        PrintMilling(parts)
+
+    if Args.simulate:
+        PrintTravel(keyboard, Args.simulate)
+
+    builds, reused = Memo.Stats()
+    print("Shapes:")
+    print(F"    Unique:       {builds}")
+    print(F"    Reused:       {reused}")
+    print()
+
+    if Cache is not None:
+        hits, misses, saved = Cache.Stats()
+        evicted = Cache.Trim()
+        print("Cache:")
+        print(F"    Hits:         {hits}")
+        print(F"    Misses:       {misses}")
+        print(F"    Evicted:      {evicted}")
+        print(F"    Time saved:   {saved:.6f}s")
+        print()
+
+    if Args.profile:
+        Profile.Save(Args.profile)
+        Profile.PrintTop(Args.profile_top)
+        print(F"Profile saved to {Args.profile}")
+        print()
+
+    if over:
+        print(F"Over the memory budget of {Args.memory_budget:.0f}MB: {', '.join(over)}")
+        print()
+        sys.exit(1)
+
+    return parts
+
+
+if __name__ == "__main__":
+    main()
+elif CQEditor:
+    main([])
@@ -0,0 +1,209 @@
+import numpy as np
+import argparse
+import time
+
+#Layout of the keys without any geometry, so it can be evaluated for many design variants at once.
+#Every parameter can be a scalar or an array of variants, the results have one row per variant and one column per key
+
+Notes = ["C","C#","D","D#","E","F","F#","G","G#","A","A#","B"]
+WhiteNotes = [0, 2, 4, 5, 7, 9, 11]
+IsBlack = np.array(["#" in note for note in Notes])
+
+#Index of a note like "A0" or "C4" counted in semitones from C0
+def NoteIndex(name):
+    note = name.rstrip("0123456789-")
+    octave = int(name[len(note):] or 0)
+    return octave*12 + Notes.index(note)
+
+def NoteName(index):
+    return Notes[index%12] + str(index//12)
+
+class KeyLayout(object):
+    def __init__(self, first=0, count=12, width=24*7, spacing=1.5, wallThick=3, gap=0.2):
+        params = np.broadcast_arrays(*[np.atleast_1d(np.asarray(value, dtype=float)) for value in (width, spacing, wallThick, gap)])
+        self.Width, self.Spacing, self.WallThick, self.Gap = [param[:, None] for param in params]
+
+        w = self.Width
+        s = self.Spacing
+
+        self.WhiteWidth = w/7 - s
+        self.BlackWidth = w/12 - s
+
+        #= One octave =
+        offsets = np.zeros((len(w), 12))
+        offsets[:, WhiteNotes] = s/2 + np.arange(7)*w/7
+
+        #Left and right side of each white key, where the black keys are placed against
+        left = offsets - self.WhiteWidth/2 + self.BlackWidth/2
+        right = offsets + self.WhiteWidth/2 - self.BlackWidth/2
+
+        bw = self.BlackWidth[:, 0]
+        ww = self.WhiteWidth[:, 0]
+        s = s[:, 0]
+        offsets[:, 1] = left[:, 0] + bw + s
+        offsets[:, 3] = right[:, 4] - bw - s
+        offsets[:, 6] = left[:, 5] + bw + s
+        offsets[:, 8] = offsets[:, 7] + ww/2 + s/2
+        offsets[:, 10] = right[:, 11] - bw - s
+
+        #The size is the distance between the two black keys, minus the 2x the spacing
+        widths = np.repeat(self.BlackWidth, 12, axis=1)
+        widths[:, 2] = offsets[:, 3]-offsets[:, 1] - bw - s*2
+        widths[:, 7] = offsets[:, 8]-offsets[:, 6] - bw - s*2
+        widths[:, 9] = offsets[:, 10]-offsets[:, 8] - bw - s*2
+
+        #Offsets from the key extension to place the base, relative to rectangle centers (zero for black keys)
+        baseOffsets = np.zeros((len(w), 12))
+        baseOffsets[:, 0] = -ww/2 + widths[:, 0]/2
+        baseOffsets[:, 4] = ww/2 - widths[:, 4]/2
+        baseOffsets[:, 5] = -ww/2 + widths[:, 5]/2
+        baseOffsets[:, 7] = (offsets[:, 6]+offsets[:, 8])/2 - offsets[:, 7]
+        baseOffsets[:, 9] = (offsets[:, 8]+offsets[:, 10])/2 - offsets[:, 9]
+        baseOffsets[:, 11] = ww/2 - widths[:, 11]/2
+
+        #= Key range =
+        self.Keys = first + np.arange(count)
+        self.Notes = self.Keys % 12
+        self.Black = IsBlack[self.Notes]
+        shift = (self.Keys//12 - first//12) * w
+
+        self.KeyOffsets = offsets[:, self.Notes] + shift
+        self.BaseWidths = widths[:, self.Notes]
+        self.BaseOffsets = baseOffsets[:, self.Notes]
+        #Global positions of the center of the mounts of each key
+        self.MountPos = self.KeyOffsets + self.BaseOffsets + self.WhiteWidth/2
+
+        self.Validate()
+
+    #Clearance between each spacer wall and the notches cut into the key bases either side of it
+    def Validate(self):
+        #Width of the notch cut into each side of a key base for the spacer
+        self.Notch = (self.WallThick - self.Spacing)/2 + self.Gap
+
+        left = self.MountPos - self.BaseWidths/2
+        right = self.MountPos + self.BaseWidths/2
+        self.KeyGaps = left[:, 1:] - right[:, :-1]
+
+        #The spacer is centered KeySpacing/2 from the right of each key base
+        self.Clearance = np.minimum(np.broadcast_to(self.Gap, self.KeyGaps.shape), self.KeyGaps - self.Spacing + self.Gap)
+
+        self.Valid = (self.Clearance >= 0).all(axis=1) \
+            & (self.KeyGaps >= self.Spacing - 1e-9).all(axis=1) \
+            & (self.BaseWidths > 2*self.Notch).all(axis=1) \
+            & (self.Notch[:, 0] > 0)
+
+        return self.Valid
+
+    #Dictionary of one variant, keyed by note name like the tables in Keyboard.py
+    def Table(self, values, variant=0, whiteOnly=False):
+        return {
+            Notes[note]: float(value)
+            for note, value, black in zip(self.Notes, values[variant], self.Black)
+            if not (whiteOnly and black)
+        }
+
+    def Print(self, variant=0):
+        print(F"    {'Key':6}{'Offset':>10}{'Width':>10}{'Mount':>10}{'Clearance':>11}")
+        clearance = np.append(self.Clearance[variant], np.nan)
+        for i, key in enumerate(self.Keys):
+            print(F"    {NoteName(key):6}{self.KeyOffsets[variant, i]:10.3f}{self.BaseWidths[variant, i]:10.3f}{self.MountPos[variant, i]:10.3f}{clearance[i]:11.3f}")
+        print(F"    Valid:        {bool(self.Valid[variant])}")
+
+#Monte Carlo stack-up of the printed fits, with no geometry. Every printed size is off by bias plus a normal error of
+#sigma mm, outwards, so parts grow and cuts shrink, and every spacer wall is off its place by a normal error of sigma.
+#Each key floats between the spacer walls either side of it with the part of its base between the two notches, so its
+#side play is the space between the walls minus that part. The spring holder sits in its hole with holderGap all round,
+#its play is the hole minus the holder, which only depends on the errors and not on the size of the hole. Samples are
+#drawn chunk at a time, so millions only take as much memory as one chunk, and the errors are drawn as float32 and
+#added to the nominal play, which is small enough for float32 to be exact to 1e-7mm.
+#Returns, for one variant of the layout, the nominal play and the mean and standard deviation of the play of each key,
+#the share of samples where it binds (no play) or wobbles (more than wobble mm), and the same for the spring holder
+def Tolerance(layout, samples, sigma=0.05, bias=0, wobble=0.5, holderGap=0.2, variant=0, rng=None, chunk=1<<16):
+    rng = np.random.default_rng() if rng is None else rng
+
+    mounts = layout.MountPos[variant]
+    widths = layout.BaseWidths[variant]
+    spacing = layout.Spacing[variant, 0]
+
+    #Space between the spacer walls either side of each key, placed like the keyboard does, minus the part of the key
+    #base between its notches
+    walls = np.append(mounts[0]-widths[0]/2-spacing/2, mounts+widths/2+spacing/2)
+    nominal = np.diff(walls) - layout.WallThick[variant, 0] - (widths - 2*layout.Notch[variant, 0])
+
+    keys = len(mounts)
+    total, squares, bind, wobbles = np.zeros(keys), np.zeros(keys), np.zeros(keys), np.zeros(keys)
+    anyBind = anyWobble = 0
+    holder = np.zeros(4)
+    for start in range(0, samples, chunk):
+        n = min(chunk, samples-start)
+        error = rng.standard_normal((n, 3*keys+4), dtype=np.float32)
+        error *= sigma
+        #Wall places, wall thicknesses, the parts between the notches, and the spring hole and holder
+        place, thick, tongue = error[:, :keys+1], error[:, keys+1:2*keys+2], error[:, 2*keys+2:3*keys+2]
+        hole, plug = error[:, 3*keys+2], error[:, 3*keys+3]
+
+        #The bias grows both walls by half of it on the key's side, and the key by all of it
+        play = np.diff(place, axis=1)
+        play -= (thick[:, 1:]+thick[:, :-1])/2
+        play -= tongue
+        play += (nominal - 2*bias).astype(np.float32)
+
+        binds, loose = play <= 0, play > wobble
+        total += play.sum(axis=0, dtype=np.float64)
+        squares += np.square(play).sum(axis=0, dtype=np.float64)
+        bind += binds.sum(axis=0)
+        wobbles += loose.sum(axis=0)
+        anyBind += binds.any(axis=1).sum()
+        anyWobble += loose.any(axis=1).sum()
+
+        #The hole shrinks and the holder grows
+        holderPlay = np.float32(2*holderGap - 2*bias) - hole - plug
+        holder += [holderPlay.sum(dtype=np.float64), np.square(holderPlay).sum(dtype=np.float64), (holderPlay <= 0).sum(), (holderPlay > wobble).sum()]
+
+    mean = total/samples
+    holderMean = holder[0]/samples
+    return {
+        "Nominal": nominal,
+        "Mean": mean,
+        "Std": np.sqrt(np.maximum(squares/samples - mean**2, 0)),
+        "Bind": bind/samples,
+        "Wobble": wobbles/samples,
+        "AnyBind": anyBind/samples,
+        "AnyWobble": anyWobble/samples,
+        "Holder": {
+            "Nominal": 2*holderGap,
+            "Mean": holderMean,
+            "Std": np.sqrt(max(holder[1]/samples - holderMean**2, 0)),
+            "Bind": holder[2]/samples,
+            "Wobble": holder[3]/samples,
+        },
+    }
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description="Print the key layout for a range of keys")
+    Parser.add_argument("--first", default="C0", help="Lowest key, eg. A0 for an 88 key piano (default C0)")
+    Parser.add_argument("--keys", type=int, default=12, help="Number of keys (default 12)")
+    Parser.add_argument("--variants", type=int, default=0,
+        help="Also time the layout of N random variants of the spacing and spacer parameters")
+    Args = Parser.parse_args()
+
+    layout = KeyLayout(NoteIndex(Args.first), Args.keys)
+    print()
+    print(F"Layout ({Args.keys} keys from {Args.first}):")
+    layout.Print()
+    print()
+
+    if Args.variants:
+        rng = np.random.default_rng()
+        start = time.time()
+        variants = KeyLayout(NoteIndex(Args.first), Args.keys,
+            spacing=rng.uniform(0.5, 3, Args.variants),
+            wallThick=rng.uniform(1, 5, Args.variants),
+            gap=rng.uniform(0, 0.5, Args.variants))
+        elapsed = time.time()-start
+
+        print(F"Variants:")
+        print(F"    Evaluated:    {Args.variants}")
+        print(F"    Valid:        {int(variants.Valid.sum())}")
+        print(F"    Time:         {elapsed:.6f}s  ({Args.variants/elapsed:.0f}/s)")
+        print()
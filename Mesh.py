@@ -0,0 +1,306 @@
+import numpy as np
+import os
+import mmap
+import zipfile
+import tempfile
+
+#Triangle meshes as NumPy arrays, so parts can be moved, measured and written many times without going back to OCCT
+
+#Outputs larger than this many bytes are written through a memory map instead of one buffer
+MmapSize = 256*1024*1024
+
+#Binary STL triangle record, 50 bytes with no padding
+StlTriangle = np.dtype([("Normal", "<f4", (3,)), ("Corners", "<f4", (3, 3)), ("Attribute", "<u2")])
+
+class Mesh(object):
+    def __init__(self, vertices, triangles):
+        self.Vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        self.Triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+    #Tessellate the shape with OCCT and read the triangulation back in bulk. Reading it a node and a triangle at a time
+    #through OCP costs more than the tessellation itself, so OCCT writes it out as binary STL, which is read into arrays
+    #in one go
+    @staticmethod
+    def FromShape(shape, tolerance=0.05, angularTolerance=0.1, relative=False):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "Mesh.stl")
+            WriteShapeSTL(path, shape, tolerance, angularTolerance, relative)
+            return Mesh.FromSTL(path)
+
+    #Read a binary STL, the corners repeated for every triangle are merged into shared vertices
+    @staticmethod
+    def FromSTL(path):
+        #Adding 0 turns -0 into 0, so the corners can be compared as 12 bytes each, much faster than by row
+        corners = np.fromfile(path, dtype=StlTriangle, offset=84)["Corners"].reshape(-1, 3) + np.float32(0)
+        _, first, index = np.unique(corners.view(np.dtype((np.void, 12))).ravel(), return_index=True, return_inverse=True)
+        return Mesh(corners[first], index.reshape(-1))
+
+    def Save(self, path, **info):
+        with open(path, "wb") as f:
+            np.savez(f, Vertices=self.Vertices, Triangles=self.Triangles, **info)
+
+    #Returns the mesh and the info saved with it
+    @staticmethod
+    def Load(path):
+        with np.load(path) as data:
+            info = {name: data[name].item() for name in data.files if name not in ("Vertices", "Triangles")}
+            return Mesh(data["Vertices"], data["Triangles"]), info
+
+    def Translated(self, offset):
+        return Mesh(self.Vertices + np.asarray(offset, dtype=float), self.Triangles)
+
+    #The three corners of every triangle, (triangles, 3, 3)
+    def Corners(self):
+        return self.Vertices[self.Triangles]
+
+    def Normals(self):
+        corners = self.Corners()
+        normals = np.cross(corners[:, 1]-corners[:, 0], corners[:, 2]-corners[:, 0])
+        return normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-300)[:, None]
+
+    #Edges between triangles at more than angle degrees to each other, plus any open edges, as (edges, 2) vertex indices.
+    #The edges inside a flat face are left out
+    def FeatureEdges(self, angle=10):
+        edges = np.sort(np.stack([self.Triangles, np.roll(self.Triangles, -1, axis=1)], axis=2).reshape(-1, 2), axis=1)
+        owner = np.repeat(np.arange(len(self.Triangles)), 3)
+
+        order = np.lexsort((edges[:, 1], edges[:, 0]))
+        edges, owner = edges[order], owner[order]
+        unique, start, count = np.unique(edges, axis=0, return_index=True, return_counts=True)
+
+        normals = self.Normals()
+        shared = count == 2
+        cosine = (normals[owner[start]]*normals[owner[np.minimum(start+1, len(owner)-1)]]).sum(axis=1)
+        sharp = ~shared | (cosine < np.cos(np.radians(angle)))
+
+        return unique[sharp]
+
+    #The vertices plus points along every feature edge no more than spacing apart.
+    #The closest features of two meshes are always a vertex and a face or two edges, so this is all a distance check needs
+    def EdgePoints(self, spacing):
+        edges = self.FeatureEdges()
+        starts = self.Vertices[edges[:, 0]]
+        ends = self.Vertices[edges[:, 1]]
+
+        counts = np.ceil(np.linalg.norm(ends-starts, axis=1)/spacing).astype(int)
+        edge = np.repeat(np.arange(len(starts)), counts)
+        #Position of each point along its edge, 1/count apart
+        t = (np.arange(len(edge)) - np.repeat(np.cumsum(counts)-counts, counts)) / counts[edge]
+        points = starts[edge] + t[:, None]*(ends[edge]-starts[edge])
+
+        return np.unique(np.concatenate([self.Vertices, points]), axis=0)
+
+
+#Rotate points about the axis through origin
+def Rotate(points, origin, axis, angle):
+    axis = np.asarray(axis, dtype=float)
+    x, y, z = axis/np.linalg.norm(axis)
+    c, s = np.cos(angle), np.sin(angle)
+    rotation = np.array([
+        [c+x*x*(1-c),   x*y*(1-c)-z*s, x*z*(1-c)+y*s],
+        [y*x*(1-c)+z*s, c+y*y*(1-c),   y*z*(1-c)-x*s],
+        [z*x*(1-c)-y*s, z*y*(1-c)+x*s, c+z*z*(1-c)],
+    ])
+    origin = np.asarray(origin, dtype=float)
+
+    return (points-origin) @ rotation.T + origin
+
+#Bounding box of points as (min, max)
+def Bounds(points):
+    return points.min(axis=0), points.max(axis=0)
+
+#Points within margin of the box
+def PointsNear(points, box, margin):
+    low, high = box
+    return points[((points <= high+margin) & (points >= low-margin)).all(axis=1)]
+
+def SegmentDistance(points, a, b):
+    ab = b-a
+    t = np.clip(((points-a)*ab).sum(-1) / np.maximum((ab*ab).sum(-1), 1e-300), 0, 1)
+    return np.linalg.norm(points - a - t[..., None]*ab, axis=-1)
+
+#Distance of every point to the closest triangle within margin of it, or inf, points are (n, 3), corners (m, 3, 3).
+#The distance to the bounding box of a triangle is a lower bound, so only the pairs it can't rule out are measured
+def Distance(points, corners, margin):
+    result = np.full(len(points), np.inf)
+    if len(corners) == 0:
+        return result
+
+    gap = np.maximum(corners.min(axis=1) - points[:, None, :], 0) + np.maximum(points[:, None, :] - corners.max(axis=1), 0)
+    point, triangle = np.nonzero((gap*gap).sum(-1) <= margin*margin)
+    if len(point) == 0:
+        return result
+
+    p = points[point]
+    a, b, c = corners[triangle, 0], corners[triangle, 1], corners[triangle, 2]
+    normal = np.cross(b-a, c-a)
+    normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-300)[:, None]
+
+    height = ((p-a)*normal).sum(-1)
+    projected = p - height[:, None]*normal
+    #Inside the triangle when the projection is on the inner side of all three edges
+    inside = (((np.cross(b-a, projected-a))*normal).sum(-1) >= 0) \
+        & (((np.cross(c-b, projected-b))*normal).sum(-1) >= 0) \
+        & (((np.cross(a-c, projected-c))*normal).sum(-1) >= 0)
+
+    edges = np.minimum(np.minimum(SegmentDistance(p, a, b), SegmentDistance(p, b, c)), SegmentDistance(p, c, a))
+    distance = np.where(inside, np.abs(height), edges)
+
+    #The pairs come sorted by point, so the closest triangle of each is the minimum over its run
+    first = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+    result[point[first]] = np.minimum.reduceat(distance, first)
+
+    return result
+
+#Whether each point is inside the closed mesh, by counting the triangles a ray up from the point crosses
+def Inside(points, corners):
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    area = (b[:, 0]-a[:, 0])*(c[:, 1]-a[:, 1]) - (c[:, 0]-a[:, 0])*(b[:, 1]-a[:, 1])
+    #Vertical triangles are never crossed by a vertical ray
+    keep = np.abs(area) > 1e-12
+    a, b, c, area = a[keep], b[keep], c[keep], area[keep]
+
+    #Nudge the rays off the round coordinates the edges of the parts sit on, so a ray never runs through an edge
+    p = points[:, None, :] + np.array([np.sqrt(2), np.sqrt(3), 0])*1e-6
+    #Barycentric coordinates of the points in the XY projection of each triangle
+    u = ((b[:, 0]-p[..., 0])*(c[:, 1]-p[..., 1]) - (c[:, 0]-p[..., 0])*(b[:, 1]-p[..., 1])) / area
+    v = ((c[:, 0]-p[..., 0])*(a[:, 1]-p[..., 1]) - (a[:, 0]-p[..., 0])*(c[:, 1]-p[..., 1])) / area
+    w = 1-u-v
+    z = u*a[:, 2] + v*b[:, 2] + w*c[:, 2]
+
+    crossed = (u >= 0) & (v >= 0) & (w >= 0) & (z > p[..., 2])
+    return crossed.sum(axis=1) % 2 == 1
+
+#Signed distance of the points to the closed mesh, negative inside, or inf for points further than margin from it.
+#The points are sorted into cells and handled a chunk at a time, each against only the triangles near that chunk.
+#Any overlap has points of one mesh within margin of the surface of the other, so nothing is missed by the cut off
+def SignedDistance(points, corners, margin, cell=4, chunk=256):
+    result = np.full(len(points), np.inf)
+    if len(points) == 0 or len(corners) == 0:
+        return result
+
+    cells = np.floor(points/cell).astype(np.int64)
+    order = np.lexsort((points[:, 2], cells[:, 0], cells[:, 1]))
+
+    low = corners.min(axis=1)
+    high = corners.max(axis=1)
+    for start in range(0, len(order), chunk):
+        index = order[start:start+chunk]
+        p = points[index]
+        boxLow, boxHigh = Bounds(p)
+
+        near = ((low <= boxHigh+margin) & (high >= boxLow-margin)).all(axis=1)
+        if not near.any():
+            continue
+        distance = Distance(p, corners[near], margin)
+
+        close = distance <= margin
+        if close.any():
+            #A ray up from the points can only cross triangles above them that overlap them in XY
+            above = ((low[:, :2] <= boxHigh[:2]) & (high[:, :2] >= boxLow[:2])).all(axis=1) & (high[:, 2] >= boxLow[2])
+            inside = Inside(p[close], corners[above])
+            distance[np.flatnonzero(close)[inside]] *= -1
+
+        result[index] = np.where(np.abs(distance) <= margin, distance, np.inf)
+
+    return result
+
+ThreeMFTypes = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+"""
+
+ThreeMFRels = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+"""
+
+def Escape(text):
+    return text.replace("&", "&amp;").replace("\"", "&quot;").replace("<", "&lt;").replace(">", "&gt;")
+
+#Transform turning points angle radians about Z then moving them by translation, as a 3x4 matrix
+def Placement(translation, angle=0):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0, translation[0]], [s, c, 0, translation[1]], [0, 0, 1, translation[2]]])
+
+#Write a 3MF file where each mesh is stored once, and placed by every item using it.
+#meshes is a list of (name, Mesh), items a list of (mesh index, Placement, part number)
+def Write3MF(path, meshes, items):
+    model = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<model unit="millimeter" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+        '<resources>\n']
+    for index, (name, mesh) in enumerate(meshes):
+        model.append(F'<object id="{index+1}" name="{Escape(name)}" type="model">\n<mesh>\n<vertices>\n')
+        model.append(('<vertex x="%.6g" y="%.6g" z="%.6g"/>\n' * len(mesh.Vertices)) % tuple(mesh.Vertices.ravel()))
+        model.append('</vertices>\n<triangles>\n')
+        model.append(('<triangle v1="%d" v2="%d" v3="%d"/>\n' * len(mesh.Triangles)) % tuple(mesh.Triangles.ravel()))
+        model.append('</triangles>\n</mesh>\n</object>\n')
+    model.append('</resources>\n<build>\n')
+    for index, placement, part in items:
+        #3MF transforms row vectors, so the rotation is written transposed with the translation last
+        transform = " ".join(F"{value:.6g}" for value in np.vstack([placement[:, :3].T, placement[:, 3]]).ravel())
+        model.append(F'<item objectid="{index+1}" transform="{transform}" partnumber="{Escape(part)}"/>\n')
+    model.append('</build>\n</model>\n')
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", ThreeMFTypes)
+        archive.writestr("_rels/.rels", ThreeMFRels)
+        archive.writestr("3D/3dmodel.model", "".join(model))
+
+#Tessellate the shape and write it as binary STL with OCCT, without going through arrays at all. With relative the
+#tolerance is scaled by the size of each edge, like cq.exporters.export does. Returns the size of the file
+def WriteShapeSTL(path, shape, tolerance=0.05, angularTolerance=0.1, relative=False):
+    #Only here, so meshes can be loaded and written without loading OCCT
+    from OCP.BRepMesh import BRepMesh_IncrementalMesh
+    from OCP.StlAPI import StlAPI_Writer
+
+    BRepMesh_IncrementalMesh(shape.wrapped, tolerance, relative, angularTolerance, True)
+    writer = StlAPI_Writer()
+    writer.ASCIIMode = False
+    if not writer.Write(shape.wrapped, path):
+        raise OSError(F"Can't write {path}")
+    return os.path.getsize(path)
+
+#Write binary STL of meshes placed at translations, as (Mesh, translation), in one file.
+#The records are filled in one structured array and written in a single call, or for outputs over MmapSize
+#filled in place in a memory map of the file so the whole output is never held in memory twice
+def WriteSTL(path, meshes, useMmap=None):
+    count = sum(len(mesh.Triangles) for mesh, _ in meshes)
+    header = np.zeros(84, dtype=np.uint8)
+    header[:80] = np.frombuffer(b"Keytar binary STL".ljust(80), dtype=np.uint8)
+    header[80:] = np.frombuffer(np.uint32(count).tobytes(), dtype=np.uint8)
+
+    size = header.nbytes + count*StlTriangle.itemsize
+    if useMmap is None:
+        useMmap = size > MmapSize
+
+    with open(path, "w+b" if useMmap else "wb") as f:
+        if useMmap:
+            f.truncate(size)
+            buffer = mmap.mmap(f.fileno(), size)
+            records = np.frombuffer(buffer, dtype=StlTriangle, offset=header.nbytes)
+            buffer[:header.nbytes] = header.tobytes()
+        else:
+            records = np.empty(count, dtype=StlTriangle)
+
+        start = 0
+        for mesh, translation in meshes:
+            end = start+len(mesh.Triangles)
+            records["Corners"][start:end] = mesh.Corners() + np.asarray(translation, dtype=float)
+            records["Normal"][start:end] = mesh.Normals()
+            records["Attribute"][start:end] = 0
+            start = end
+
+        if useMmap:
+            #The array has to let go of the map before it can be closed
+            del records
+            buffer.flush()
+            buffer.close()
+        else:
+            f.write(header.tobytes())
+            f.write(records.data)
+
+    return size
@@ -0,0 +1,102 @@
+import numpy as np
+
+#Concave corners of a solid, for checking that a milling bit reaches into them.
+#The faces and edges are read out of OCCT once into arrays, everything after that is NumPy over all of them at once
+
+#Edges whose faces meet at less than this many degrees are smooth, like the edges along a fillet
+SmoothAngle = 1
+#Edges and faces within this many degrees of the tool axis run along it
+AxisAngle = 1
+
+#Per edge of every face: the index of the edge, the index of the face, the middle of the edge, the outward normal of the
+#face there, the direction into the face, square to the edge, and the direction of the edge. Per face: its point in the
+#middle, the largest curvature towards the outside of the solid, which is positive where the face is hollow, like a
+#fillet or a hole, and the direction it doesn't bend in that much, the axis of a fillet or a hole. 0 when it bends the
+#same in every direction
+def Extract(shape):
+    #Only here, so the checks can be run on arrays without loading OCCT
+    from OCP.TopExp import TopExp, TopExp_Explorer
+    from OCP.TopAbs import TopAbs_EDGE, TopAbs_FACE, TopAbs_REVERSED
+    from OCP.TopTools import TopTools_IndexedMapOfShape
+    from OCP.TopoDS import TopoDS
+    from OCP.BRep import BRep_Tool
+    from OCP.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_Curve, BRepAdaptor_Curve2d
+    from OCP.BRepLProp import BRepLProp_SLProps
+    from OCP.gp import gp_Pnt, gp_Vec, gp_Dir
+
+    edges = TopTools_IndexedMapOfShape()
+    TopExp.MapShapes_s(shape.wrapped, TopAbs_EDGE, edges)
+
+    rows = []
+    faces = []
+    explorer = TopExp_Explorer(shape.wrapped, TopAbs_FACE)
+    while explorer.More():
+        face = TopoDS.Face_s(explorer.Current())
+        #Reversed faces point the other way from their surface
+        sign = -1 if face.Orientation() == TopAbs_REVERSED else 1
+        surface = BRepAdaptor_Surface(face)
+
+        u = (surface.FirstUParameter()+surface.LastUParameter())/2
+        v = (surface.FirstVParameter()+surface.LastVParameter())/2
+        props = BRepLProp_SLProps(surface, u, v, 2, 1e-7)
+        curvature, axis = 0, (0, 0, 0)
+        if props.IsCurvatureDefined():
+            curvature = max(sign*props.MaxCurvature(), sign*props.MinCurvature())
+            if not props.IsUmbilic():
+                largest, smallest = gp_Dir(), gp_Dir()
+                props.CurvatureDirections(largest, smallest)
+                #Seen from the outside the largest curvature is the smallest one of the surface on reversed faces
+                axis = (smallest if sign > 0 else largest).Coord()
+        faces.append((*props.Value().Coord(), curvature, *axis))
+
+        edgeExplorer = TopExp_Explorer(face, TopAbs_EDGE)
+        while edgeExplorer.More():
+            edge = TopoDS.Edge_s(edgeExplorer.Current())
+            if not BRep_Tool.Degenerated_s(edge):
+                curve = BRepAdaptor_Curve(edge)
+                t = (curve.FirstParameter()+curve.LastParameter())/2
+                point, tangent = gp_Pnt(), gp_Vec()
+                curve.D1(t, point, tangent)
+                if edge.Orientation() == TopAbs_REVERSED:
+                    tangent.Reverse()
+
+                uv = BRepAdaptor_Curve2d(edge, face).Value(t)
+                normal = BRepLProp_SLProps(surface, uv.X(), uv.Y(), 1, 1e-7).Normal()
+                rows.append((edges.FindIndex(edge), len(faces)-1, *point.Coord(), *(sign*np.array(normal.Coord())), *tangent.Coord()))
+            edgeExplorer.Next()
+        explorer.Next()
+
+    rows = np.array(rows, dtype=float).reshape(-1, 11)
+    faces = np.array(faces, dtype=float).reshape(-1, 7)
+
+    normals = rows[:, 5:8]
+    tangents = rows[:, 8:11] / np.maximum(np.linalg.norm(rows[:, 8:11], axis=1), 1e-300)[:, None]
+    #The face lies to the left of its edges, seen from the outside
+    inwards = np.cross(normals, tangents)
+
+    return rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64), rows[:, 2:5], normals, inwards, tangents, faces
+
+#Returns the radius and the place of every concave corner a bit along axis has to go round: 0 for the sharp concave edges
+#along the axis, where one face rises from the outside of the other, and the radius of curvature for the hollow faces
+#whose axis is along it. Corners across the axis, like the edges between a floor and its walls, are cut by the end of the bit
+def ConcaveCorners(shape, axis=(0, 0, 1)):
+    edge, face, points, normals, inwards, tangents, faces = Extract(shape)
+    axis = np.asarray(axis, dtype=float)/np.linalg.norm(axis)
+    along = np.cos(np.radians(AxisAngle))
+
+    #Pair up the two faces of each edge, leaving out the seams, which have the same face on both sides
+    order = np.lexsort((face, edge))
+    _, start, count = np.unique(edge[order], return_index=True, return_counts=True)
+    a, b = order[start[count == 2]], order[start[count == 2]+1]
+    a, b = a[face[a] != face[b]], b[face[a] != face[b]]
+
+    rises = ((normals[a]*inwards[b]).sum(axis=1) + (normals[b]*inwards[a]).sum(axis=1))/2
+    cosine = (normals[a]*normals[b]).sum(axis=1)
+    sharp = (rises > 0) & (cosine < np.cos(np.radians(SmoothAngle))) & (np.abs(tangents[a] @ axis) > along)
+
+    #Faces bending the same way in every direction have no axis, the bit has to go round them from any side
+    faceAxis = faces[:, 4:7] @ axis
+    hollow = (faces[:, 3] > 0) & ((np.abs(faceAxis) > along) | ~faces[:, 4:7].any(axis=1))
+    radii = np.concatenate([np.zeros(sharp.sum()), 1/faces[hollow, 3]])
+    places = np.concatenate([points[a[sharp]], faces[hollow, :3]])
+    return radii, places
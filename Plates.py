@@ -0,0 +1,85 @@
+import numpy as np
+import argparse
+import time
+
+#Packing of part footprints onto printer build plates, without any geometry.
+#Uses first fit decreasing height shelves: parts are turned so their long side runs along the bed, sorted tallest first,
+#and put on the first shelf of any plate with room left, a new shelf when none has, and a new plate when no plate has
+
+class Shelf(object):
+    def __init__(self, y, height):
+        self.Y = y
+        self.Height = height
+        self.Used = 0
+
+#Returns (plate, x, y, turned) for every size (width, depth), or None for parts that don't fit on the bed at all.
+#x and y are the corner of the footprint on the plate, turned means the part is rotated 90 degrees
+def Pack(sizes, bed, gap=0):
+    bedWidth, bedDepth = bed[0]+gap, bed[1]+gap
+
+    placed = [None]*len(sizes)
+    parts = []
+    for index, (width, depth) in enumerate(sizes):
+        width, depth = width+gap, depth+gap
+        #Long side along the width of the bed when it fits, which keeps the shelves low
+        turned = depth > width
+        if turned:
+            width, depth = depth, width
+        if width > bedWidth or depth > bedDepth:
+            turned = not turned
+            width, depth = depth, width
+            if width > bedWidth or depth > bedDepth:
+                continue
+        parts.append((depth, width, turned, index))
+
+    plates = []
+    for depth, width, turned, index in sorted(parts, key=lambda part: (-part[0], -part[1])):
+        for plate, (shelves, top) in enumerate(plates):
+            shelf = next((shelf for shelf in shelves if shelf.Height >= depth and shelf.Used+width <= bedWidth), None)
+            if shelf is None and top+depth <= bedDepth:
+                shelf = Shelf(top, depth)
+                shelves.append(shelf)
+                plates[plate][1] = top+depth
+            if shelf is not None:
+                break
+        else:
+            plate = len(plates)
+            shelf = Shelf(0, depth)
+            plates.append([[shelf], depth])
+
+        placed[index] = (plate, shelf.Used, shelf.Y, turned)
+        shelf.Used += width
+
+    return placed
+
+#Share of the area of each plate covered by the footprints
+def Fill(sizes, placed, bed):
+    plates = max((place[0] for place in placed if place is not None), default=-1)+1
+    area = np.zeros(plates)
+    for (width, depth), place in zip(sizes, placed):
+        if place is not None:
+            area[place[0]] += width*depth
+    return area / (bed[0]*bed[1])
+
+
+if __name__ == "__main__":
+    Parser = argparse.ArgumentParser(description="Time the packing of random parts onto build plates")
+    Parser.add_argument("--parts", type=int, default=300, help="Number of parts (default 300)")
+    Parser.add_argument("--bed", default="220x220", help="Bed size in mm (default 220x220)")
+    Args = Parser.parse_args()
+
+    bed = tuple(float(size) for size in Args.bed.split("x"))
+    rng = np.random.default_rng()
+    sizes = np.column_stack([rng.uniform(5, 150, Args.parts), rng.uniform(5, 30, Args.parts)]).tolist()
+
+    start = time.time()
+    placed = Pack(sizes, bed, 3)
+    elapsed = time.time()-start
+
+    fill = Fill(sizes, placed, bed)
+    print()
+    print(F"Plates ({Args.parts} parts on {Args.bed}):")
+    print(F"    Plates:       {len(fill)}")
+    print(F"    Fill:         {fill.mean()*100:.1f}%")
+    print(F"    Time:         {elapsed:.6f}s")
+    print()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import inspect
+import functools
+import contextlib
+import tracemalloc
+
+#Measuring the build of Keyboard.py: where the time goes with Profiler, and the memory each part takes with MemoryMonitor
+
+#Nested timings of parts, their feature methods and the CadQuery operations they run.
+#The Chrome trace can be opened in chrome://tracing or https://ui.perfetto.dev
+class Profiler(object):
+    #Workplane operations that are timed, the ones that end up in the OCCT kernel
+    Operations = [
+        "box", "extrude", "loft", "shell", "fillet", "hole",
+        "cut", "cutBlind", "cutThruAll", "union", "__add__", "__sub__",
+        "translate", "rotate", "mirror", "faces", "edges", "workplane",
+    ]
+
+    def __init__(self):
+        self.Enabled = False
+        self.Events = []
+        #Time spent in the children of each open span, to work out its self time
+        self.Children = []
+
+    def Enable(self, classes):
+        self.Enabled = True
+
+        for cls in classes:
+            for attr, func in list(vars(cls).items()):
+                if inspect.isfunction(func) and not attr.startswith("__") and attr != "Params":
+                    self.Wrap(cls, attr, F"{cls.__name__}.{attr}")
+
+        #Only here, so importing this doesn't load CadQuery
+        import cadquery as cq
+        for attr in self.Operations:
+            self.Wrap(cq.Workplane, attr, F"Workplane.{attr}")
+
+    #A method wrapped by an earlier profiler, like the one of the last build in Server.py or CQ-editor, is unwrapped first
+    #so it's only timed once, and only by this one
+    def Wrap(self, cls, attr, name):
+        func = getattr(cls, attr)
+        while getattr(func, "Profiler", None) is not None:
+            func = func.__wrapped__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.Span(name):
+                return func(*args, **kwargs)
+
+        wrapper.Profiler = self
+        setattr(cls, attr, wrapper)
+
+    @contextlib.contextmanager
+    def Span(self, name):
+        if not self.Enabled:
+            yield
+            return
+
+        self.Children.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter()-start
+            children = self.Children.pop()
+            if self.Children:
+                self.Children[-1] += duration
+
+            self.Events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+                "ts": start*1e6, "dur": duration*1e6, "args": {"self": (duration-children)*1e6},
+            })
+
+    #Hand over the events recorded so far, used to send them back from the build workers
+    def Take(self):
+        events = self.Events
+        self.Events = []
+        return events
+
+    def Save(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.Events, "displayTimeUnit": "ms"}, f)
+
+    def PrintTop(self, count):
+        totals = {}
+        for event in self.Events:
+            calls, total, own = totals.get(event["name"], (0, 0, 0))
+            totals[event["name"]] = (calls+1, total+event["dur"]/1e6, own+event["args"]["self"]/1e6)
+
+        print("Profile:")
+        print(F"    {'':32} {'Calls':>6} {'Total':>10} {'Self':>10}")
+        for name, (calls, total, own) in sorted(totals.items(), key=lambda item: -item[1][2])[:count]:
+            print(F"    {name:32} {calls:6} {total:9.6f}s {own:9.6f}s")
+        print()
+
+#Peak memory of building and exporting each part: the resident set of the process, which includes what OCCT allocates,
+#and the Python objects traced by tracemalloc. The resident peak is reset before each part through /proc/self/clear_refs
+#on Linux, elsewhere it's the peak of the process so far
+class MemoryMonitor(object):
+    def __init__(self):
+        self.Enabled = False
+        #Name: (resident before, peak resident, resident after, peak traced), in bytes
+        self.Parts = {}
+
+    def Enable(self):
+        self.Enabled = True
+        tracemalloc.start()
+
+    #VmRSS or VmHWM from /proc/self/status in bytes, None where there is no /proc
+    @staticmethod
+    def Status(field):
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith(field+":"):
+                        return int(line.split()[1])*1024
+        except OSError:
+            return None
+
+    @staticmethod
+    def ResetPeak():
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+    def PeakRSS(self):
+        peak = self.Status("VmHWM")
+        if peak is None:
+            try:
+                import resource
+            except ImportError:
+                return None
+            #kB on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return peak
+
+    @contextlib.contextmanager
+    def Span(self, name):
+        if not self.Enabled:
+            yield
+            return
+
+        before = self.Status("VmRSS")
+        self.ResetPeak()
+        tracemalloc.reset_peak()
+        traced = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            self.Parts[name] = (before, self.PeakRSS(), self.Status("VmRSS"), tracemalloc.get_traced_memory()[1]-traced)
+
+    #Hand over the parts measured so far, used to send them back from the build workers
+    def Take(self):
+        parts = self.Parts
+        self.Parts = {}
+        return parts
+
+    #Returns the names of the parts that went over budget bytes
+    def Print(self, budget=None):
+        print(F"Memory (MB{F', budget {budget/1024**2:.0f}MB' if budget else ''}):")
+        print(F"    {'':14}{'Before':>9}{'Peak':>9}{'Added':>9}{'After':>9}{'Python':>9}")
+        over = []
+        MB = lambda value: F"{value/1024**2:9.1f}" if value is not None else F"{'-':>9}"
+        for name, (before, peak, after, traced) in self.Parts.items():
+            added = peak-before if peak is not None and before is not None else None
+            if budget and peak is not None and peak > budget:
+                over.append(name)
+            print(F"    {name+':':14}{MB(before)}{MB(peak)}{MB(added)}{MB(after)}{MB(traced)}{'  OVER' if name in over else ''}")
+        peaks = [peak for _, peak, _, _ in self.Parts.values() if peak is not None]
+        if peaks:
+            print(F"    {':: Peak ::':14}{'':9}{MB(max(peaks))}")
+        print()
+
+        return over
@@ -0,0 +1,211 @@
+import cadquery as cq
+import os
+import sys
+import ast
+import json
+import time
+import types
+import tempfile
+import argparse
+import threading
+import http.server
+import urllib.parse
+
+from Sweep import KeyboardPath, Override
+
+#Keeps CadQuery loaded and the built shapes in memory, and builds Keyboard.py again whenever it or the parameter file
+#changes. Parts whose hash didn't change are taken from memory, so a rebuild only costs the parts that did change,
+#and only their STLs are written again.
+#Local clients can ask for the parts over HTTP:
+#    GET  /status            the last build, the parts it rebuilt and the files it exported
+#    GET  /parts             every part with its hash and parameters
+#    GET  /parts/NAME.stl    the mesh of one part, eg. /parts/C%23.stl
+#    POST /build             build now, eg. after changing something the server doesn't watch
+#    POST /export            build and rewrite every STL
+
+Parser = argparse.ArgumentParser(description="Build Keyboard.py again whenever it changes, keeping the shapes in memory")
+Parser.add_argument("--params", metavar="FILE",
+    help="JSON file of constants to override, eg. {\"KeySpacer.Gap\": 0.3}, watched like Keyboard.py")
+Parser.add_argument("--port", type=int, default=8765,
+    help="Port on localhost the clients connect to (default 8765)")
+Parser.add_argument("--interval", type=float, default=0.5,
+    help="Seconds between checks for changed files (default 0.5)")
+Parser.add_argument("args", nargs=argparse.REMAINDER,
+    help="Options passed on to Keyboard.py after --, eg. -- --draft")
+
+
+class BuildServer(object):
+    def __init__(self, params, argv):
+        self.ParamsPath = params
+        self.Argv = argv
+
+        #Shared with every build of Keyboard.py, see WarmShapes there
+        self.Shapes = {}
+        self.Keyboard = None
+        self.Parts = {}
+        self.Status = {"Builds": 0}
+        self.Lock = threading.Lock()
+
+    def Overrides(self):
+        if self.ParamsPath is None:
+            return {}
+        with open(self.ParamsPath) as f:
+            return json.load(f)
+
+    def Watched(self):
+        return [path for path in [KeyboardPath, self.ParamsPath] if path is not None]
+
+    def Mtimes(self):
+        mtimes = {}
+        for path in self.Watched():
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def Build(self, exportAll=False):
+        with self.Lock:
+            previous = set(self.Shapes)
+            overrides = self.Overrides()
+            with open(KeyboardPath) as f:
+                tree = Override(ast.parse(f.read(), KeyboardPath), overrides)
+
+            #Run it as a module of its own so its parts can be pickled for the build workers
+            module = types.ModuleType("KeyboardServer")
+            module.__file__ = KeyboardPath
+            module.WarmShapes = self.Shapes
+            sys.modules[module.__name__] = module
+
+            start = time.time()
+            exec(compile(tree, KeyboardPath, "exec"), module.__dict__)
+            try:
+                parts = module.main(self.Argv + (["--export-all"] if exportAll else []))
+            except SystemExit as e:
+                #main exits after the options that only report, like --plan, and when a part goes over --memory-budget
+                raise RuntimeError(F"Keyboard.py exited with status {e.code or 0}") from None
+            buildtime = time.time()-start
+
+            keyboard = module.__dict__
+            hashes = {name: keyboard["PartHash"](part) for name, part in parts.items()}
+
+            #Only keep the shapes of this build, older versions of the parts would pile up otherwise
+            for digest in set(self.Shapes) - set(hashes.values()):
+                del self.Shapes[digest]
+
+            self.Keyboard = keyboard
+            self.Parts = parts
+            self.Status = {
+                "Builds": self.Status["Builds"]+1,
+                "BuildTime": buildtime,
+                "Overrides": overrides,
+                "Rebuilt": [name for name, digest in hashes.items() if digest not in previous],
+                "Exported": [filename for filename, _, _, _, written in keyboard["Exporter"].Results if written],
+                "Unchanged": keyboard["Exporter"].Unchanged,
+            }
+            return self.Status
+
+    def PartList(self):
+        with self.Lock:
+            return {
+                name: {"Hash": self.Keyboard["PartHash"](part), "Params": part.Params()}
+                for name, part in self.Parts.items()
+            }
+
+    def PartSTL(self, name):
+        with self.Lock:
+            part = self.Parts.get(name)
+            if part is None:
+                return None
+
+            #The mesh comes from the geometry cache when the part was exported before
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, "Part.stl")
+                self.Keyboard["ExportSTL"](part.Obj, path, self.Keyboard["PartHash"](part))
+                with open(path, "rb") as f:
+                    return f.read()
+
+    def PrintStatus(self, status):
+        print(F"Build {status['Builds']}:")
+        print(F"    Time:         {status['BuildTime']:.6f}s")
+        print(F"    Rebuilt:      {', '.join(status['Rebuilt']) or '-'}")
+        print(F"    Exported:     {', '.join(status['Exported']) or '-'}")
+        print()
+
+    def TryBuild(self, exportAll=False):
+        try:
+            self.PrintStatus(self.Build(exportAll))
+        except Exception as e:
+            #Keep serving the last good build while the file is being edited
+            print(F"Build failed: {type(e).__name__}: {e}")
+            print()
+
+    def Watch(self, interval):
+        mtimes = self.Mtimes()
+        while True:
+            time.sleep(interval)
+            current = self.Mtimes()
+            if current != mtimes:
+                changed = [os.path.basename(path) for path in current if current[path] != mtimes.get(path)]
+                mtimes = current
+                print(F"Changed: {', '.join(changed)}")
+                self.TryBuild()
+
+
+def Handler(server):
+    class RequestHandler(http.server.BaseHTTPRequestHandler):
+        def Send(self, code, body, contentType="application/json"):
+            if contentType == "application/json":
+                body = json.dumps(body, indent=4).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urllib.parse.unquote(self.path)
+            if path == "/status":
+                self.Send(200, server.Status)
+            elif path == "/parts":
+                self.Send(200, server.PartList())
+            elif path.startswith("/parts/") and path.endswith(".stl"):
+                stl = server.PartSTL(path[len("/parts/"):-len(".stl")])
+                if stl is None:
+                    self.Send(404, {"Error": F"No part {path}"})
+                else:
+                    self.Send(200, stl, "model/stl")
+            else:
+                self.Send(404, {"Error": F"Unknown path {path}"})
+
+        def do_POST(self):
+            if self.path in ("/build", "/export"):
+                try:
+                    self.Send(200, server.Build(self.path == "/export"))
+                except Exception as e:
+                    self.Send(500, {"Error": F"{type(e).__name__}: {e}"})
+            else:
+                self.Send(404, {"Error": F"Unknown path {self.path}"})
+
+        def log_message(self, format, *args):
+            print(F"    {self.command} {self.path}")
+
+    return RequestHandler
+
+
+if __name__ == "__main__":
+    Args = Parser.parse_args()
+    argv = Args.args[1:] if Args.args[:1] == ["--"] else Args.args
+
+    server = BuildServer(Args.params, argv)
+    server.TryBuild()
+
+    httpd = http.server.HTTPServer(("127.0.0.1", Args.port), Handler(server))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    print(F"Watching {', '.join(os.path.basename(path) for path in server.Watched())}, serving on http://127.0.0.1:{Args.port}")
+    print()
+    try:
+        server.Watch(Args.interval)
+    except KeyboardInterrupt:
+        httpd.shutdown()
@@ -0,0 +1,156 @@
+import cadquery as cq
+import ast
+import io
+import os
+import sys
+import time
+import json
+import types
+import itertools
+import argparse
+import contextlib
+import multiprocessing
+import concurrent.futures
+
+#Builds Keyboard.py once for every combination of parameter values.
+#Each variant is Keyboard.py with its constants edited, so values derived from them in the class bodies follow along.
+#The variants share the geometry cache, so parts that don't depend on the swept parameters are only built once, before
+#the variants start
+
+KeyboardPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Keyboard.py")
+
+Parser = argparse.ArgumentParser(description="Build Keyboard.py for every combination of parameter values")
+Parser.add_argument("--param", metavar="NAME=VALUES", action="append", default=[],
+    help="Parameter and the comma separated values to try, eg. Octave.KeySpacing=1,1.5,2 or WallThickness=2.5,3")
+Parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+    help="Number of variants built at once (default all cores)")
+Parser.add_argument("--output", default="Sweep/",
+    help="Folder the results and the exports of each variant are written to (default Sweep/)")
+
+
+def ParseGrid(params):
+    grid = {}
+    for param in params:
+        name, values = param.split("=", 1)
+        grid[name.strip()] = [ast.literal_eval(value.strip()) for value in values.split(",")]
+    return grid
+
+#Replace the value of the constants in the source, names are either module level like WallThickness or Class.Attr
+def Override(tree, overrides):
+    remaining = dict(overrides)
+
+    def Replace(body, prefix):
+        for node in body:
+            if isinstance(node, ast.ClassDef) and not prefix:
+                Replace(node.body, node.name+".")
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                name = prefix + node.targets[0].id
+                if name in remaining:
+                    node.value = ast.copy_location(ast.Constant(remaining.pop(name)), node.value)
+
+    Replace(tree.body, "")
+    if remaining:
+        raise KeyError(F"No constant named {', '.join(remaining)} in Keyboard.py")
+
+    return tree
+
+#Build the parts none of the swept parameters affect into the geometry cache, from Keyboard.py as it is, and return their
+#names. Otherwise on a cold cache the first variants, up to one per job, would all miss the cache and build them at once
+def BuildShared(grid):
+    with open(KeyboardPath) as f:
+        tree = ast.parse(f.read(), KeyboardPath)
+
+    module = types.ModuleType("KeyboardShared")
+    module.__file__ = KeyboardPath
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(compile(tree, KeyboardPath, "exec"), module.__dict__)
+        keyboard = module.__dict__
+        if keyboard["Cache"] is None:
+            return []
+
+        parts = keyboard["MakeKeyboard"](keyboard["Args"]).Parts().values()
+        shared = [part for part in parts if not any(keyboard["AffectedParts"](param, [part]) for param in grid)]
+        for part in shared:
+            part.Obj
+
+    return [keyboard["PartName"](part) for part in shared]
+
+def RunVariant(index, overrides, output):
+    folder = os.path.join(output, F"Variant{index:03}")
+
+    with open(KeyboardPath) as f:
+        tree = Override(ast.parse(f.read(), KeyboardPath), {**overrides, "ExportFolder": folder+"/"})
+
+    #Run it as a module of its own so its parts can be pickled for the build workers
+    module = types.ModuleType("KeyboardVariant")
+    module.__file__ = KeyboardPath
+    sys.modules[module.__name__] = module
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(compile(tree, KeyboardPath, "exec"), module.__dict__)
+        parts = module.main([])
+    buildtime = time.time()-start
+
+    keyboard = module.__dict__
+    hits, misses, saved = keyboard["Cache"].Stats() if keyboard["Cache"] is not None else (0, 0, 0)
+
+    return {
+        "Variant": index,
+        "Params": overrides,
+        "BuildTime": buildtime,
+        "LayoutValid": bool(keyboard["OctaveLayout"].Valid[0]),
+        "SolidsValid": all(part.Obj.val().isValid() for part in parts.values()),
+        "Volumes": {name: part.Obj.val().Volume() for name, part in parts.items()},
+        "ExportSize": sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder) if name.endswith(".stl")),
+        "CacheHits": hits,
+        "CacheMisses": misses,
+    }
+
+def PrintResults(grid, results):
+    names = list(grid)
+    print(F"    {'':4}" + "".join(F"{name:>22}" for name in names) + F"{'Time':>11}{'Valid':>7}{'Keys':>12}{'Base':>12}{'Holder':>10}{'Export':>11}{'Hits':>6}")
+    for result in results:
+        volumes = result["Volumes"]
+        keys = sum(volume for name, volume in volumes.items() if name not in ("Base", "KeySpacer", "SpringHolder", "KeyStop"))
+        valid = "yes" if result["LayoutValid"] and result["SolidsValid"] else "NO"
+        print(F"    {result['Variant']:<4}" + "".join(F"{result['Params'][name]!s:>22}" for name in names)
+            + F"{result['BuildTime']:10.3f}s{valid:>7}{keys:12.1f}{volumes['Base']:12.1f}{volumes['SpringHolder']:10.2f}"
+            + F"{result['ExportSize']/1024:9.1f}kB{result['CacheHits']:6}")
+
+
+if __name__ == "__main__":
+    Args = Parser.parse_args()
+
+    grid = ParseGrid(Args.param)
+    variants = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+    print()
+    print(F"Sweep ({len(variants)} variants, {Args.jobs} jobs):")
+
+    start = time.time()
+    shared = BuildShared(grid)
+    print(F"    Shared:       {time.time()-start:.6f}s  {', '.join(shared) or '-'}")
+
+    results = []
+    #Fork so every worker starts with CadQuery already loaded
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(Args.jobs, mp_context=context) as pool:
+        futures = [pool.submit(RunVariant, index, variant, Args.output) for index, variant in enumerate(variants)]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+            print(F"    Variant {results[-1]['Variant']:<4}{results[-1]['BuildTime']:.6f}s")
+    results.sort(key=lambda result: result["Variant"])
+
+    print()
+    print("Results:")
+    PrintResults(grid, results)
+    print(F"    :: Total ::   {time.time()-start:.6f}s")
+    print()
+
+    os.makedirs(Args.output, exist_ok=True)
+    with open(os.path.join(Args.output, "Results.json"), "w") as f:
+        json.dump(results, f, indent=4)
+    print(F"Results saved to {os.path.join(Args.output, 'Results.json')}")
+    print()